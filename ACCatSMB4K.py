@@ -1,8 +1,14 @@
 import pygame
 import sys
+import os
+import gc
+import time
 import random
-
-pygame.init()
+import threading
+import pickle
+import hashlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
 
 # -------------------------------------------------
 # CONFIG
@@ -10,8 +16,26 @@ pygame.init()
 SCREEN_WIDTH, SCREEN_HEIGHT = 800, 600
 FPS = 60
 TILE = 32
+RENDER_SCALE = 2  # low-res render path draws the world at 1/RENDER_SCALE
+GC_DEFER_LIMIT = 120  # frames an old-generation collection may wait for spare frame time
+SECTION_TILES = 16  # level is pre-rendered in sections this many tiles wide
+PREFETCH_SECTIONS = 3  # sections rasterized ahead of the camera
+RASTER_THREADS = 2
+GOOMBA_SPEED = 2
+CHASE_RANGE = 8 * TILE  # goombas that can see the player this close walk toward it
+GOOMBA_JUMP = -12  # pursuing goombas hop along the nav graph's jump edges
+NAV_RUNUP = 3  # tiles back from a surface end tried as jump launch points
+NAV_DROP, NAV_JUMP = 1, 2  # no walk kind: abutting tiles already merge into one surface
+LEVEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".levelcache")
+PROFILE_INTERVAL = 0.002  # seconds between stack samples while profiling (F9 or SMB_PROFILE=file)
+PROFILE_NOTICE = 4  # seconds the written profile's path stays on screen
+REPLAY_HEADER = struct.Struct("<4s16s")  # magic, level cache key; then one button byte per frame
+REPLAY_MAGIC = b"ACR1"
+BUTTON_KEYS = ((pygame.K_LEFT, 1), (pygame.K_RIGHT, 2), (pygame.K_SPACE, 4))
+PLAYER_START = (32, 17 * TILE - 56)  # left edge, standing on the ground
 GRAVITY = 0.8
 MAX_FALL = 14
+FALL_LIMIT = 1000  # y past which nothing comes back: the player dies, goombas are retired
 JUMP_POWER = -17
 WALK_SPEED = 6
 FRICTION = 0.85
@@ -25,19 +49,174 @@ BRICK_COLOR = (180,90,30)
 QUESTION_COLOR = (248,184,0)
 PIPE_COLOR = (0,200,0)
 HIDDEN_COLOR = None  # invisible
+USED_COLOR = (136,72,16)  # question or hidden block after it has been hit
 FLAG_COLOR = (200,200,200)
 GOLD = (248,184,0)
 
-screen = pygame.display.set_mode((SCREEN_WIDTH,SCREEN_HEIGHT))
-pygame.display.set_caption("SMB Deluxe – World 1-1 LOCK")
-clock = pygame.time.Clock()
-
-font_big = pygame.font.Font(None,72)
-font_small = pygame.font.Font(None,40)
-
 # -------------------------------------------------
 # BASIC OBJECTS
 # -------------------------------------------------
+class Canvas:
+    # World draw target; in low-res mode draws go to a small surface that is
+    # upscaled into the window once per frame
+    def __init__(self,window):
+        self.window = window
+        self.low = pygame.Surface((SCREEN_WIDTH//RENDER_SCALE,SCREEN_HEIGHT//RENDER_SCALE)).convert()
+        self.set_low_res(False)
+
+    def set_low_res(self,on):
+        self.scale = RENDER_SCALE if on else 1
+        self.surface = self.low if on else self.window
+
+    def toggle(self):
+        self.set_low_res(self.scale == 1)
+
+    def fill(self,color):
+        self.surface.fill(color)
+
+    def rect(self,color,rect):
+        s = self.scale
+        if s == 1:
+            pygame.draw.rect(self.surface,color,rect)
+            return
+        x,y,w,h = rect
+        pygame.draw.rect(self.surface,color,(x//s,y//s,w//s,h//s))
+
+    def circle(self,color,center,radius):
+        s = self.scale
+        pygame.draw.circle(self.surface,color,(center[0]//s,center[1]//s),max(1,radius//s))
+
+    def blit(self,surface,pos):
+        s = self.scale
+        self.surface.blit(surface,(pos[0]//s,pos[1]//s))
+
+    def present(self):
+        if self.scale != 1:
+            pygame.transform.scale(self.low,self.window.get_size(),self.window)
+
+class FrameTimer:
+    # Smoothed world render time (fill + draw + upscale) per render scale
+    def __init__(self):
+        self.ms = {1: 0.0, RENDER_SCALE: 0.0}
+        self.start = 0.0
+
+    def begin(self):
+        self.start = time.perf_counter()
+
+    def end(self,scale):
+        ms = (time.perf_counter() - self.start) * 1000
+        self.ms[scale] += (ms - self.ms[scale]) * 0.1
+
+    def text(self,scale):
+        full,low = self.ms[1],self.ms[RENDER_SCALE]
+        saving = f" ({full/low:.1f}x)" if full and low else ""
+        return f"RES 1/{scale} [F2]  full {full:.2f}ms  low {low:.2f}ms{saving}"
+
+class GCPacer:
+    # Keeps collector pauses out of gameplay frames: the built level is frozen
+    # out of the collector, automatic collection is off while playing and the
+    # young generations are collected between frames. Pauses are timed per
+    # generation through gc.callbacks.
+    def __init__(self):
+        self.last_ms = [0.0,0.0,0.0]
+        self.max_ms = [0.0,0.0,0.0]
+        self.counts = [0,0,0]
+        self.deferred = 0
+        self.start = 0.0
+        gc.callbacks.append(self.on_gc)
+
+    def on_gc(self,phase,info):
+        if phase == "start":
+            self.start = time.perf_counter()
+            return
+        g = info["generation"]
+        ms = (time.perf_counter() - self.start) * 1000
+        self.last_ms[g] = ms
+        self.max_ms[g] = max(self.max_ms[g],ms)
+        self.counts[g] += 1
+
+    def level_built(self):
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+    def set_playing(self,playing):
+        if playing and gc.isenabled():
+            gc.disable()
+        elif not playing and not gc.isenabled():
+            gc.enable()
+
+    def frame_boundary(self,spare_ms):
+        if gc.isenabled():
+            return
+        count = gc.get_count()
+        threshold = gc.get_threshold()
+        gen = -1
+        for g in range(3):
+            if count[g] > threshold[g]:
+                gen = g
+        if gen < 0:
+            return
+        # Older generations wait for a frame with enough spare time, at most GC_DEFER_LIMIT frames
+        if gen > 0 and self.last_ms[gen] > spare_ms and self.deferred < GC_DEFER_LIMIT:
+            self.deferred += 1
+            gen = 0
+        else:
+            self.deferred = 0
+        gc.collect(gen)
+
+    def text(self):
+        return "GC " + "  ".join(f"g{g} x{self.counts[g]} {self.last_ms[g]:.2f}/{self.max_ms[g]:.2f}ms" for g in range(3))
+
+class SamplingProfiler:
+    # Samples the main thread's stack from a side thread and counts
+    # identical stacks, each under two root frames: the game state and the
+    # camera's level section at sample time. stop() writes the counts in
+    # collapsed-stack form ("frame;frame;frame count" per line) for
+    # flamegraph.pl, speedscope and friends. Nothing runs while it is off.
+    def __init__(self,where,path=None):
+        self.where = where  # called from the sampler thread: -> (state name, level x)
+        self.path = path or time.strftime("profile-%Y%m%d-%H%M%S.folded")
+        self.target = threading.main_thread().ident
+        self.counts = {}
+        self.samples = 0
+        self.written = None  # perf_counter time stop() wrote the file
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while not self.stopping.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self.target)
+            if frame is None:
+                continue
+            state, x = self.where()
+            codes = []
+            while frame is not None:
+                codes.append(frame.f_code)
+                frame = frame.f_back
+            key = (state, x // (SECTION_TILES * TILE), tuple(codes))
+            self.counts[key] = self.counts.get(key,0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self.stopping.set()
+        self.thread.join()
+        width = SECTION_TILES * TILE
+        with open(self.path,"w") as f:
+            for (state, section, codes), count in self.counts.items():
+                frames = [state, f"x {section * width}-{(section + 1) * width - 1}"]
+                for code in reversed(codes):
+                    frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                f.write(";".join(frames) + f" {count}\n")
+        self.written = time.perf_counter()
+        return self.path
+
+    def text(self):
+        if self.written is not None:
+            return f"PROFILE WRITTEN {self.samples} samples -> {self.path}"
+        return f"PROFILING {self.samples} samples -> {self.path} (F9 stops)"
+
 class Block:
     def __init__(self, x, y, w, h, color):
         self.rect = pygame.Rect(x, y, w, h)
@@ -46,9 +225,17 @@ class Block:
 class Goomba:
     def __init__(self,x,y):
         self.rect = pygame.Rect(x,y,32,32)
-        self.vx = -2
+        self.spawn(x,y)
+
+    def spawn(self,x,y):
+        # Also used by EntityPool to bring a recycled goomba back to life
+        self.rect.topleft = (x,y)
+        self.vx = -GOOMBA_SPEED
         self.vy = 0
         self.alive = True
+        self.on_ground = False
+        self.heading = -1  # kept while the goomba waits at an edge with vx == 0
+        self.leap = None  # surface a goomba is deliberately walking off
 
     def update(self,platforms):
         if not self.alive:
@@ -60,26 +247,73 @@ class Goomba:
         for p in platforms:
             if self.rect.colliderect(p.rect):
                 self.vx *= -1
+                self.heading = -self.heading
                 self.rect.x += self.vx * 2
                 
         self.rect.y += self.vy
+        self.on_ground = False
         for p in platforms:
             if self.rect.colliderect(p.rect):
                 if self.vy > 0:
                     self.rect.bottom = p.rect.top
                     self.vy = 0
+                    self.on_ground = True
+
+        # Same line the player dies at, so nothing it can reach is lost; this
+        # only lets reap() return goombas that fell into a pit to the pool
+        if self.rect.y > FALL_LIMIT:
+            self.alive = False
 
     def draw(self,camera):
         if self.alive:
-            pygame.draw.rect(screen, (180,90,30), camera.apply(self.rect))
+            canvas.rect((180,90,30), camera.apply(self.rect))
+
+class EntityPool:
+    # Dead entities go back on a free list instead of being dropped, and
+    # spawn() reuses them, so restarting the level allocates nothing once
+    # the pool has grown to the level's entity count. Active lists hold live
+    # entities only: reap() swap-removes the dead (order is not kept).
+    def __init__(self,cls):
+        self.cls = cls
+        self.free = []
+        self.made = 0
+
+    def spawn(self,x,y):
+        if self.free:
+            e = self.free.pop()
+            e.spawn(x,y)
+            return e
+        self.made += 1
+        return self.cls(x,y)
+
+    def reap(self,active):
+        i = len(active) - 1
+        while i >= 0:
+            e = active[i]
+            if not e.alive:
+                active[i] = active[-1]
+                active.pop()
+                self.free.append(e)
+            i -= 1
+
+    def release(self,active):
+        self.free.extend(active)
+        active.clear()
+
+    def text(self,active):
+        return f"entities {len(active)} live {len(self.free)} free {self.made} made"
 
 class Camera:
     def __init__(self,width):
         self.x = 0
         self.width = width
+        self.view = pygame.Rect(0,0,0,0)  # reused by apply(), valid until the next call
 
     def apply(self,rect):
-        return rect.move(self.x,0)
+        view = self.view
+        view.update(rect)
+        view.x += self.x
+        return view
 
     def update(self,target):
         self.x = -target.rect.centerx + SCREEN_WIDTH//2
@@ -97,15 +331,21 @@ class Player:
         self.on_ground = False
         self.dead = False
         self.win = False
+        self.facing = 1
+        self.bumped = None  # block hit from below this frame, handled by bump_block
+        self.coins = 0
+        self.stomps = 0
 
-    def update(self,platforms,goombas,flag,keys):
+    def update(self,platforms,hidden,goombas,flag,keys):
         if self.dead or self.win:
             return
 
         if keys[pygame.K_LEFT]:
             self.vx -= 0.5
+            self.facing = -1
         elif keys[pygame.K_RIGHT]:
             self.vx += 0.5
+            self.facing = 1
         else:
             self.vx *= FRICTION
 
@@ -141,12 +381,22 @@ class Player:
                 elif self.vy < 0:
                     self.rect.top = p.rect.bottom
                     self.vy = 0
+                    self.bumped = p
+
+        # Hidden blocks only exist for a head coming up from below
+        if self.vy < 0:
+            for h in hidden:
+                if self.rect.colliderect(h.rect):
+                    self.rect.top = h.rect.bottom
+                    self.vy = 0
+                    self.bumped = h
 
         # Goomba collision
         for g in goombas:
             if g.alive and self.rect.colliderect(g.rect):
                 if self.vy > 0 and self.rect.bottom - 10 < g.rect.top + 20:
                     g.alive = False
+                    self.stomps += 1
                     self.vy = -8
                 else:
                     self.dead = True
@@ -155,22 +405,23 @@ class Player:
         if self.rect.colliderect(flag):
             self.win = True
         
-        if self.rect.y > 1000:
+        if self.rect.y > FALL_LIMIT:
             self.dead = True
 
     def draw(self,camera):
         r = camera.apply(self.rect)
-        pygame.draw.rect(screen,(232,32,32),(r.x,r.y+20,28,16))
-        pygame.draw.rect(screen,(32,56,236),(r.x+4,r.y+36,8,20))
-        pygame.draw.rect(screen,(32,56,236),(r.x+16,r.y+36,8,20))
-        pygame.draw.rect(screen,(228,188,136),(r.x+4,r.y,20,20))
+        canvas.rect((232,32,32),(r.x,r.y+20,28,16))
+        canvas.rect((32,56,236),(r.x+4,r.y+36,8,20))
+        canvas.rect((32,56,236),(r.x+16,r.y+36,8,20))
+        canvas.rect((228,188,136),(r.x+4,r.y,20,20))
 
 # -------------------------------------------------
 # LEVEL BUILD (ACCURATE 1-1)
 # -------------------------------------------------
-def build_level():
+def build_level(goomba_pool):
     width_tiles = 220
     platforms = []
+    hidden = []
     goombas = []
 
     # Helper to add a pipe
@@ -213,7 +464,7 @@ def build_level():
     # -------------------------------------------------
     # Hidden block (row 13)
     # -------------------------------------------------
-    platforms.append(Block(91 * TILE, 13 * TILE, TILE, TILE, HIDDEN_COLOR))
+    hidden.append(Block(91 * TILE, 13 * TILE, TILE, TILE, HIDDEN_COLOR))
 
     # -------------------------------------------------
     # Bricks at row 13
@@ -289,9 +540,748 @@ def build_level():
     # -------------------------------------------------
     goomba_positions = [21, 50, 52, 65, 67, 80, 82, 100, 102, 104, 128, 135, 137, 148, 150, 182, 184]
     for x in goomba_positions:
-        goombas.append(Goomba(x * TILE, 16 * TILE))
+        goombas.append(goomba_pool.spawn(x * TILE, 16 * TILE))
+
+    # Position in platforms, so a block can be swap-removed in O(1)
+    for i, p in enumerate(platforms):
+        p.index = i
+
+    return platforms, hidden, goombas, flag, width_tiles * TILE
+
+# -------------------------------------------------
+# BUMPING BLOCKS
+# -------------------------------------------------
+def bump_block(block, player, platforms, hidden, goombas, grid, nav, sections):
+    # Bricks break, question and hidden blocks pay a coin and turn into used
+    # blocks. Every structure touched is patched for this one tile: platforms
+    # by swap-remove or append, one grid cell, the nav surfaces around that
+    # cell and one tile in each cached surface of the block's section.
+    if block.color in (GROUND_COLOR, PIPE_COLOR):
+        return  # static, and possibly a merged run rather than one tile
+    col = block.rect.x // TILE
+    row = block.rect.y // TILE
+    for g in goombas:
+        if g.alive and g.rect.bottom == block.rect.top and g.rect.right > block.rect.left and g.rect.left < block.rect.right:
+            g.alive = False
 
-    return platforms, goombas, flag, width_tiles * TILE
+    if block.color == BRICK_COLOR:
+        last = platforms.pop()
+        if last is not block:
+            platforms[block.index] = last
+            last.index = block.index
+        # Pyramid bases sit on ground tiles, which stay solid under them
+        if block.rect.collidelist([p.rect for p in platforms]) < 0:
+            grid.set_solid(col, row, False)
+            nav.update_tile(col, row)
+        if sections:
+            sections.remove_block(block)
+    elif block.color is HIDDEN_COLOR:
+        hidden.remove(block)
+        block.color = USED_COLOR
+        block.index = len(platforms)
+        platforms.append(block)
+        grid.set_solid(col, row, True)
+        nav.update_tile(col, row)
+        if sections:
+            sections.add_block(block)
+        player.coins += 1
+    elif block.color == QUESTION_COLOR:
+        block.color = USED_COLOR
+        if sections:
+            sections.repaint(block)
+        player.coins += 1
+
+# -------------------------------------------------
+# LEVEL QUERIES
+# -------------------------------------------------
+class TileGrid:
+    # Solid/empty occupancy of the level, one byte per TILE cell. Rays walk
+    # the grid cell by cell (Amanatides-Woo DDA), so a query costs the cells
+    # it crosses rather than a pass over the whole platforms list.
+    def __init__(self, platforms, level_width, cells=None):
+        self.cols = level_width // TILE
+        self.rows = (SCREEN_HEIGHT + TILE - 1) // TILE
+        if cells is not None:
+            # Precompiled by LevelCache; copied because bumped blocks edit it
+            self.cells = bytearray(cells)
+        else:
+            self.cells = bytearray(self.cols * self.rows)
+            for p in platforms:
+                r = p.rect
+                for row in range(r.top // TILE, (r.bottom - 1) // TILE + 1):
+                    for col in range(r.left // TILE, (r.right - 1) // TILE + 1):
+                        self.set_solid(col, row, True)
+        self.queries = 0
+        self.visits = 0
+
+    def set_solid(self, col, row, solid):
+        if 0 <= col < self.cols and 0 <= row < self.rows:
+            self.cells[row * self.cols + col] = solid
+
+    def solid(self, col, row):
+        # Outside the grid is open air: pits fall out the bottom, nothing above
+        return 0 <= col < self.cols and 0 <= row < self.rows and self.cells[row * self.cols + col] == 1
+
+    def raycast(self, origin, direction, max_dist):
+        # Returns (distance, col, row) of the first solid cell along the ray,
+        # or None if nothing is hit within max_dist pixels
+        self.queries += 1
+        x, y = origin
+        dx, dy = direction
+        length = (dx * dx + dy * dy) ** 0.5
+        if length == 0:
+            return None
+        dx /= length
+        dy /= length
+        col = int(x // TILE)
+        row = int(y // TILE)
+        step_col = 1 if dx > 0 else -1
+        step_row = 1 if dy > 0 else -1
+        # Distance along the ray to the next vertical / horizontal cell border
+        if dx:
+            next_x = ((col + (dx > 0)) * TILE - x) / dx
+            delta_x = TILE / abs(dx)
+        else:
+            next_x = delta_x = float("inf")
+        if dy:
+            next_y = ((row + (dy > 0)) * TILE - y) / dy
+            delta_y = TILE / abs(dy)
+        else:
+            next_y = delta_y = float("inf")
+        cols, rows, cells = self.cols, self.rows, self.cells
+        dist = 0.0
+        while dist <= max_dist:
+            self.visits += 1
+            if 0 <= col < cols and 0 <= row < rows and cells[row * cols + col] == 1:
+                return dist, col, row
+            if next_x < next_y:
+                dist = next_x
+                next_x += delta_x
+                col += step_col
+            else:
+                dist = next_y
+                next_y += delta_y
+                row += step_row
+        return None
+
+    def raycast_many(self, rays):
+        # Batched form: one call per frame for every (origin, direction, max_dist)
+        raycast = self.raycast
+        return [raycast(origin, direction, max_dist) for origin, direction, max_dist in rays]
+
+    def line_of_sight(self, a, b):
+        dx = b[0] - a[0]
+        dy = b[1] - a[1]
+        return self.raycast(a, (dx, dy), (dx * dx + dy * dy) ** 0.5) is None
+
+    def ground_below(self, x, y):
+        # y of the first solid surface at or under (x, y), or None over a pit.
+        # A straight-down ray only ever steps rows, so walk the column directly.
+        self.queries += 1
+        col = int(x // TILE)
+        if not 0 <= col < self.cols:
+            return None
+        for row in range(max(0, int(y // TILE)), self.rows):
+            self.visits += 1
+            if self.cells[row * self.cols + col] == 1:
+                return row * TILE
+        return None
+
+    def text(self):
+        return f"rays {self.queries} cells {self.visits}"
+
+class NavGraph:
+    # Built once per level from the tile grid. Surfaces are runs of solid
+    # tiles with open air above; drop and jump edges between them come from
+    # replaying Goomba.update's physics from each surface end. next_hop holds
+    # the first edge of a shortest route for every (from, to) pair, so
+    # pursuit at run time is two lookups and no search. A tile bumped in or
+    # out of the grid rescans only its rows and relinks only the surfaces a
+    # flight could reach it from.
+    def __init__(self, grid, tables=None):
+        self.grid = grid
+        if tables is not None:
+            # Precompiled by LevelCache; copied because bumped tiles edit them
+            surfaces, surface_at, self.edges, self.out, self.next_hop = tables
+            self.surfaces = list(surfaces)
+            self.surface_at = list(surface_at)
+            return
+        self.surfaces = []  # (row, first col, last col), or None once a bump removed it
+        self.surface_at = [-1] * (grid.cols * grid.rows)
+        for row in range(grid.rows):
+            for first, last in self.runs(row, 0, grid.cols - 1):
+                self.place(len(self.surfaces), row, first, last)
+        self.edges = []  # (kind, launch x, heading, target surface)
+        self.out = []  # surface -> its edge indices
+        self.relink(range(len(self.surfaces)))
+
+    def runs(self, row, lo, hi):
+        # Runs of surface tiles (solid, open above) in row between cols lo..hi
+        grid = self.grid
+        found = []
+        col = lo
+        while col <= hi:
+            if grid.solid(col, row) and not grid.solid(col, row - 1):
+                first = col
+                while col + 1 <= hi and grid.solid(col + 1, row) and not grid.solid(col + 1, row - 1):
+                    col += 1
+                found.append((first, col))
+            col += 1
+        return found
+
+    def place(self, s, row, first, last):
+        if s == len(self.surfaces):
+            self.surfaces.append(None)
+        self.surfaces[s] = (row, first, last)
+        for c in range(first, last + 1):
+            self.surface_at[row * self.grid.cols + c] = s
+
+    def links(self, s):
+        # Edges out of surface s, found by flying from each end
+        row, first, last = self.surfaces[s]
+        found = []
+        for heading, end in ((-1, first), (1, last)):
+            x = end * TILE
+            y = row * TILE - TILE
+            target = self.fly(s, x, y, heading, 0)
+            if target is not None:
+                found.append((NAV_DROP, x, heading, target))
+            for back in range(NAV_RUNUP + 1):
+                col = end - back * heading
+                if not first <= col <= last:
+                    break
+                target = self.fly(s, col * TILE, y, heading, GOOMBA_JUMP)
+                if target is not None:
+                    found.append((NAV_JUMP, col * TILE, heading, target))
+                    break
+        return found
+
+    def relink(self, dirty):
+        # Flies again from the dirty surfaces, keeps everyone else's edges,
+        # then redoes the all-pairs routes (cheap next to the flights)
+        dirty = set(dirty)
+        edges = []
+        out = []
+        for s, surface in enumerate(self.surfaces):
+            if surface is None:
+                found = []
+            elif s in dirty:
+                found = self.links(s)
+            else:
+                found = [self.edges[e] for e in self.out[s]]
+            out.append([])
+            for edge in found:
+                if edge[3] != s:
+                    out[s].append(len(edges))
+                    edges.append(edge)
+        self.edges = edges
+        self.out = out
+
+        n = len(self.surfaces)
+        self.next_hop = [[-1] * n for _ in range(n)]
+        for s in range(n):
+            hops = self.next_hop[s]
+            frontier = [s]
+            seen = {s}
+            while frontier:
+                reached = []
+                for u in frontier:
+                    for e in self.out[u]:
+                        v = self.edges[e][3]
+                        if v not in seen:
+                            seen.add(v)
+                            hops[v] = e if u == s else hops[u]
+                            reached.append(v)
+                frontier = reached
+
+    def update_tile(self, col, row):
+        # The grid cell at (col, row) was just filled or emptied. Only its own
+        # row and the one below can gain or lose surface tiles; surfaces there
+        # keep their ids where they can, extra pieces get new ones.
+        cols = self.grid.cols
+        changed = set()
+        for r in (row, row + 1):
+            if not 0 <= r < self.grid.rows:
+                continue
+            old = []
+            for c in (col - 1, col, col + 1):
+                s = self.surface_at[r * cols + c] if 0 <= c < cols else -1
+                if s >= 0 and s not in old:
+                    old.append(s)
+            lo = min([col] + [self.surfaces[s][1] for s in old])
+            hi = max([col] + [self.surfaces[s][2] for s in old])
+            for c in range(lo, hi + 1):
+                self.surface_at[r * cols + c] = -1
+            found = self.runs(r, lo, hi)
+            for i, (first, last) in enumerate(found):
+                s = old[i] if i < len(old) else len(self.surfaces)
+                self.place(s, r, first, last)
+                changed.add(s)
+            for s in old[len(found):]:
+                self.surfaces[s] = None
+                changed.add(s)
+
+        # Any flight launched within reach of the cell may now pass, land or
+        # stop differently; so may one that landed on a reshaped surface
+        reach = GOOMBA_SPEED * FPS * 2 + (NAV_RUNUP + 1) * TILE
+        dirty = set(changed)
+        for s, surface in enumerate(self.surfaces):
+            if surface is None or s in dirty:
+                continue
+            _, first, last = surface
+            if first * TILE - reach <= col * TILE <= last * TILE + reach:
+                dirty.add(s)
+            elif any(self.edges[e][3] in changed for e in self.out[s]):
+                dirty.add(s)
+        self.relink(dirty)
+
+    def blocked(self, rect):
+        grid = self.grid
+        for row in range(rect.top // TILE, (rect.bottom - 1) // TILE + 1):
+            for col in range(rect.left // TILE, (rect.right - 1) // TILE + 1):
+                if grid.solid(col, row):
+                    return True
+        return False
+
+    def fly(self, s, x, y, heading, vy):
+        # Same steps as Goomba.update with no bounce; returns the surface
+        # landed on (other than s), or None if it hits a wall or falls out
+        rect = pygame.Rect(x, y, TILE, TILE)
+        vx = GOOMBA_SPEED * heading
+        for _ in range(FPS * 2):
+            vy = min(vy + GRAVITY, MAX_FALL)
+            rect.x += vx
+            if self.blocked(rect):
+                return None
+            rect.y += vy
+            if rect.top > SCREEN_HEIGHT:
+                return None
+            if self.blocked(rect):
+                if vy < 0:
+                    return None
+                rect.bottom = (rect.bottom - 1) // TILE * TILE
+                vy = 0
+                landed = self.surface_under(rect)
+                if landed != s:
+                    return landed
+        return None
+
+    def surface_under(self, rect):
+        row = rect.bottom // TILE
+        if not 0 <= row < self.grid.rows:
+            return None
+        base = row * self.grid.cols
+        for x in (rect.centerx, rect.left, rect.right - 1):
+            col = x // TILE
+            if 0 <= col < self.grid.cols and self.surface_at[base + col] >= 0:
+                return self.surface_at[base + col]
+        return None
+
+    def surface_below(self, rect):
+        # Surface a (possibly airborne) body will come down on
+        floor = self.grid.ground_below(rect.centerx, rect.bottom)
+        if floor is None:
+            return None
+        col = rect.centerx // TILE
+        s = self.surface_at[floor // TILE * self.grid.cols + col]
+        return s if s >= 0 else None
+
+    def text(self):
+        jumps = sum(1 for e in self.edges if e[0] == NAV_JUMP)
+        surfaces = sum(1 for s in self.surfaces if s is not None)
+        return f"nav {surfaces} surfaces {len(self.edges) - jumps} drops {jumps} jumps"
+
+def steer_goombas(grid, nav, goombas, player):
+    # Decide every live goomba's heading for this frame before any of them
+    # move: sight lines go to the grid as one batch, then each goomba probes
+    # the floor just past its leading edge. A goomba that sees the player on
+    # another surface takes the nav graph's next edge toward it.
+    grid.queries = grid.visits = 0
+    target = player.rect.center
+    seekers = []
+    rays = []
+    for g in goombas:
+        if g.alive and g.on_ground:
+            dx = target[0] - g.rect.centerx
+            dy = target[1] - g.rect.centery
+            if abs(dx) <= CHASE_RANGE and abs(dy) <= CHASE_RANGE:
+                seekers.append(g)
+                rays.append((g.rect.center, (dx, dy), (dx * dx + dy * dy) ** 0.5))
+    sees = set()
+    for g, hit in zip(seekers, grid.raycast_many(rays)):
+        if hit is None and not player.dead:
+            sees.add(g)
+
+    goal = nav.surface_below(player.rect)
+    for g in goombas:
+        if not (g.alive and g.on_ground):
+            continue
+        here = nav.surface_under(g.rect)
+        if g.leap is not None:
+            if here == g.leap:
+                continue  # still walking off toward a drop
+            g.leap = None
+        chasing = g in sees
+        if chasing and here is not None and goal is not None and here != goal:
+            e = nav.next_hop[here][goal]
+            if e >= 0:
+                kind, x, heading, _ = nav.edges[e]
+                if abs(g.rect.x - x) < GOOMBA_SPEED:
+                    g.rect.x = x
+                    g.heading = heading
+                    g.vx = GOOMBA_SPEED * heading
+                    if kind == NAV_JUMP:
+                        g.vy = GOOMBA_JUMP
+                    else:
+                        g.leap = here
+                    continue
+                g.heading = 1 if x > g.rect.x else -1
+                g.vx = GOOMBA_SPEED * g.heading
+                continue
+        if chasing and target[0] != g.rect.centerx:
+            g.heading = 1 if target[0] > g.rect.centerx else -1
+        lead = g.rect.right if g.heading > 0 else g.rect.left - 1
+        floor = grid.ground_below(lead, g.rect.bottom)
+        if floor is None or floor - g.rect.bottom > TILE:
+            # Edge ahead: a chaser waits for the player, a walker turns back
+            if chasing:
+                g.vx = 0
+                continue
+            g.heading = -g.heading
+        g.vx = GOOMBA_SPEED * g.heading
+
+# -------------------------------------------------
+# COMPILED LEVEL CACHE
+# -------------------------------------------------
+level_loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="level")
+
+def merge_blocks(platforms):
+    # Ground and pipe tiles merged into as few rects as possible: runs along
+    # each row, then equal runs stacked down the rows. Bricks and question
+    # blocks stay one per tile, since bump_block patches them one at a time.
+    blocks = []
+    tiles = {}
+    for p in platforms:
+        if p.color in (BRICK_COLOR, QUESTION_COLOR):
+            blocks.append((tuple(p.rect), p.color))
+        else:
+            tiles[p.rect.x // TILE, p.rect.y // TILE] = p.color
+    merged = []
+    below = {}  # (first col, last col, color) -> rect that may grow down
+    for row in sorted({row for _, row in tiles}):
+        cols = sorted(col for col, r in tiles if r == row)
+        start = 0
+        for i in range(len(cols)):
+            color = tiles[cols[i], row]
+            if i + 1 < len(cols) and cols[i + 1] == cols[i] + 1 and tiles[cols[i + 1], row] == color:
+                continue
+            key = (cols[start], cols[i], color)
+            rect = below.get(key)
+            if rect is not None and rect[1] + rect[3] == row * TILE:
+                rect[3] += TILE
+            else:
+                rect = [cols[start] * TILE, row * TILE, (i - start + 1) * TILE, TILE]
+                below[key] = rect
+                merged.append((rect, color))
+            start = i + 1
+    return blocks + [(tuple(rect), color) for rect, color in merged]
+
+def compile_level():
+    # The level and everything derived from it, as plain picklable data
+    platforms, hidden, goombas, flag, width = build_level(EntityPool(Goomba))
+    grid = TileGrid(platforms, width)
+    nav = NavGraph(grid)
+    return {
+        "blocks": merge_blocks(platforms),
+        "hidden": [(tuple(h.rect), h.color) for h in hidden],
+        "spawns": [g.rect.topleft for g in goombas],
+        "flag": tuple(flag),
+        "width": width,
+        "cells": bytes(grid.cells),
+        "nav": (nav.surfaces, nav.surface_at, nav.edges, nav.out, nav.next_hop),
+    }
+
+def unpack_level(data):
+    # Level objects that belong to no one else yet, so this may run on the
+    # loader thread; goombas come from the shared pool and are spawned later
+    platforms = [Block(*rect, color) for rect, color in data["blocks"]]
+    for i, p in enumerate(platforms):
+        p.index = i
+    hidden = [Block(*rect, color) for rect, color in data["hidden"]]
+    width = data["width"]
+    grid = TileGrid(platforms, width, data["cells"])
+    nav = NavGraph(grid, data["nav"])
+    return platforms, hidden, data["spawns"], pygame.Rect(data["flag"]), width, grid, nav
+
+def spawn_level(level, goomba_pool):
+    platforms, hidden, spawns, flag, width, grid, nav = level
+    goombas = [goomba_pool.spawn(x, y) for x, y in spawns]
+    return platforms, hidden, goombas, flag, width, grid, nav
+
+def load_level(data, goomba_pool):
+    return spawn_level(unpack_level(data), goomba_pool)
+
+class LevelCache:
+    # compile_level's output is pickled under a hash of this file, which
+    # holds both the level layout and the physics constants the nav graph
+    # was simulated with, so any edit recompiles. preload() turns the data
+    # into live objects on the loader thread while a menu or end screen is
+    # up; take() spawns the goombas from the pool on the calling thread and
+    # hands everything over, which is all ENTER has to wait for.
+    def __init__(self):
+        with open(__file__, "rb") as f:
+            self.key = hashlib.sha1(f.read()).hexdigest()[:16]
+        self.path = os.path.join(LEVEL_CACHE_DIR, f"1-1-{self.key}.pickle")
+        self.data = None
+        self.source = "-"
+        self.next = None
+
+    def compiled(self):
+        if self.data is None:
+            try:
+                with open(self.path, "rb") as f:
+                    self.data = pickle.load(f)
+                self.source = "disk"
+            except (OSError, EOFError, pickle.UnpicklingError):
+                self.data = compile_level()
+                self.source = "compiled"
+                try:
+                    os.makedirs(LEVEL_CACHE_DIR, exist_ok=True)
+                    with open(self.path + ".tmp", "wb") as f:
+                        pickle.dump(self.data, f, pickle.HIGHEST_PROTOCOL)
+                    os.replace(self.path + ".tmp", self.path)
+                except OSError:
+                    pass  # Read-only install: compile each run instead
+        return self.data
+
+    def preload(self):
+        self.next = level_loader.submit(lambda: unpack_level(self.compiled()))
+
+    def take(self, goomba_pool):
+        level = self.next.result()
+        self.next = None
+        return spawn_level(level, goomba_pool)
+
+    def text(self):
+        return f"LEVEL {self.source}"
+
+# -------------------------------------------------
+# LEVEL SECTION CACHE
+# -------------------------------------------------
+raster_pool = ThreadPoolExecutor(max_workers=RASTER_THREADS, thread_name_prefix="raster")
+
+class SectionCache:
+    # Level geometry pre-rendered into SECTION_TILES-wide surfaces by worker
+    # threads (Surface.fill releases the GIL). The main loop only blits
+    # finished sections; a section that is not ready yet is drawn block by
+    # block for that frame instead of waiting on it.
+    def __init__(self, platforms, level_width):
+        self.width = SECTION_TILES * TILE
+        self.count = (level_width + self.width - 1) // self.width
+        self.sections = [[] for _ in range(self.count)]
+        for p in platforms:
+            if p.color is not None:
+                # Merged ground runs can span several sections
+                last = min((p.rect.right - 1) // self.width, self.count - 1)
+                for index in range(p.rect.x // self.width, last + 1):
+                    self.sections[index].append(p)
+        self.ready = {}    # (index, scale) -> Surface
+        self.pending = {}  # (index, scale) -> Future
+        self.misses = 0
+
+    def rasterize(self, index, scale):
+        # Runs on a worker thread; only touches its own new surface
+        surf = pygame.Surface((self.width // scale, SCREEN_HEIGHT // scale), 0, screen)
+        surf.fill(SKY)
+        x0 = index * self.width
+        for p in self.sections[index]:
+            r = p.rect
+            surf.fill(p.color, ((r.x - x0) // scale, r.y // scale, r.w // scale, r.h // scale))
+        return surf
+
+    def request(self, index, scale):
+        key = (index, scale)
+        if 0 <= index < self.count and key not in self.ready and key not in self.pending:
+            self.pending[key] = raster_pool.submit(self.rasterize, index, scale)
+
+    def poll(self):
+        # Swap in finished sections without blocking
+        for key, future in list(self.pending.items()):
+            if future.done():
+                del self.pending[key]
+                self.ready[key] = future.result()
+
+    def prefetch(self, camera, player, scale):
+        # Look ahead in the direction of travel, or of facing when standing
+        first = -camera.x // self.width
+        last = (-camera.x + SCREEN_WIDTH - 1) // self.width
+        direction = 1 if player.vx > 0 else -1 if player.vx < 0 else player.facing
+        for i in range(1, PREFETCH_SECTIONS + 1):
+            self.request(last + i if direction > 0 else first - i, scale)
+
+        # Drop surfaces that are well out of range to bound memory
+        for key in list(self.ready):
+            if not first - PREFETCH_SECTIONS <= key[0] <= last + PREFETCH_SECTIONS:
+                del self.ready[key]
+
+    def draw(self, camera):
+        scale = canvas.scale
+        first = -camera.x // self.width
+        last = min((-camera.x + SCREEN_WIDTH - 1) // self.width, self.count - 1)
+        for index in range(first, last + 1):
+            surf = self.ready.get((index, scale))
+            if surf is not None:
+                canvas.blit(surf, (index * self.width + camera.x, 0))
+                continue
+            self.misses += 1
+            self.request(index, scale)
+            for p in self.sections[index]:
+                canvas.rect(p.color, camera.apply(p.rect))
+
+    def repaint(self, block):
+        # Redraws one tile in the surfaces cached for its section. A raster
+        # still in flight may have read the old tile, so it is dropped and
+        # requested again later.
+        index = block.rect.x // self.width
+        x0 = index * self.width
+        r = block.rect
+        visible = block in self.sections[index]
+        for scale in (1, RENDER_SCALE):
+            future = self.pending.pop((index, scale), None)
+            if future is not None:
+                future.cancel()
+            surf = self.ready.get((index, scale))
+            if surf is not None:
+                area = ((r.x - x0) // scale, r.y // scale, r.w // scale, r.h // scale)
+                surf.fill(SKY, area)
+                if visible:
+                    surf.fill(block.color, area)
+
+    def add_block(self, block):
+        self.sections[block.rect.x // self.width].append(block)
+        self.repaint(block)
+
+    def remove_block(self, block):
+        self.sections[block.rect.x // self.width].remove(block)
+        self.repaint(block)
+
+    def close(self):
+        for future in self.pending.values():
+            future.cancel()
+
+    def text(self):
+        return f"SECTIONS ready {len(self.ready)} pending {len(self.pending)} misses {self.misses}"
+
+# -------------------------------------------------
+# GAMEPLAY TICK AND REPLAYS
+# -------------------------------------------------
+def play_frame(player, keys, platforms, hidden, goombas, flag, grid, nav, sections, goomba_pool):
+    # One frame of play. The game loop and replay_stats.py both run it, so a
+    # recorded button stream resimulates exactly; sections may be None headless.
+    player.update(platforms, hidden, goombas, flag, keys)
+    if player.bumped:
+        bump_block(player.bumped, player, platforms, hidden, goombas, grid, nav, sections)
+        player.bumped = None
+    steer_goombas(grid, nav, goombas, player)
+    for g in goombas:
+        g.update(platforms)
+    goomba_pool.reap(goombas)
+
+def pack_buttons(keys):
+    buttons = 0
+    for key, bit in BUTTON_KEYS:
+        if keys[key]:
+            buttons |= bit
+    return buttons
+
+class ReplayKeys:
+    # Stands in for pygame.key.get_pressed() when feeding back a button byte
+    def __init__(self):
+        self.buttons = 0
+
+    def __getitem__(self,key):
+        for k, bit in BUTTON_KEYS:
+            if k == key:
+                return self.buttons & bit != 0
+        return False
+
+class ReplayRecorder:
+    # With SMB_REPLAY_DIR set, every round is saved as a header plus one
+    # button byte per frame, starting from a fresh level and PLAYER_START
+    def __init__(self,directory,level_key):
+        self.directory = directory
+        self.header = REPLAY_HEADER.pack(REPLAY_MAGIC, level_key.encode())
+        self.buttons = bytearray()
+        self.rounds = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        self.buttons.clear()
+
+    def record(self,buttons):
+        self.buttons.append(buttons)
+
+    def finish(self):
+        self.rounds += 1
+        name = time.strftime("%Y%m%d-%H%M%S") + f"-{os.getpid()}-{self.rounds}.replay"
+        with open(os.path.join(self.directory, name), "wb") as f:
+            f.write(self.header)
+            f.write(self.buttons)
+
+# -------------------------------------------------
+# PLAY SCREEN
+# -------------------------------------------------
+class Hud:
+    # Play-screen overlay. Stat lines are re-rendered twice a second and the
+    # coin counter when it changes; other frames only blit cached surfaces.
+    def __init__(self,font,coin_font,frame_timer,gc_pacer,level_cache,goomba_pool):
+        self.font = font
+        self.coin_font = coin_font
+        self.frame_timer = frame_timer
+        self.gc_pacer = gc_pacer
+        self.level_cache = level_cache
+        self.goomba_pool = goomba_pool
+        self.lines = []
+        self.coins = None
+        self.coin_surf = None
+        self.frames = 0
+
+    def draw(self,sections,grid,nav,goombas,player):
+        if self.frames % (FPS // 2) == 0:
+            texts = (self.frame_timer.text(canvas.scale), self.gc_pacer.text(),
+                     sections.text() + "  " + self.level_cache.text(), grid.text() + "  " + nav.text(),
+                     self.goomba_pool.text(goombas))
+            self.lines = [self.font.render(t, True, WHITE) for t in texts]
+        self.frames += 1
+        if player.coins != self.coins:
+            self.coins = player.coins
+            self.coin_surf = self.coin_font.render(f"COINS {player.coins}", True, GOLD)
+        for i, surf in enumerate(self.lines):
+            screen.blit(surf, (10, 10 + 20 * i))
+        screen.blit(self.coin_surf, (SCREEN_WIDTH - 150, 10))
+
+def draw_frame(camera, sections, flag, goombas, player, grid, nav, hud):
+    # Everything drawn for one frame of play; the game loop and the
+    # allocation test both run it
+    sections.poll()
+    sections.prefetch(camera, player, canvas.scale)
+
+    hud.frame_timer.begin()
+    canvas.fill(SKY)
+    # Level comes from pre-rendered sections (hidden blocks are never drawn)
+    sections.draw(camera)
+
+    # Draw flag
+    canvas.rect(FLAG_COLOR, camera.apply(flag))
+    canvas.circle(GOLD, camera.apply(flag).topleft, 8)
+
+    for g in goombas:
+        g.draw(camera)
+
+    player.draw(camera)
+    canvas.present()
+    hud.frame_timer.end(canvas.scale)
+    hud.draw(sections, grid, nav, goombas, player)
 
 # -------------------------------------------------
 # GAME LOOP
@@ -300,67 +1290,111 @@ STATE_MENU = 0
 STATE_PLAY = 1
 STATE_OVER = 2
 STATE_WIN = 3
+STATE_NAMES = {STATE_MENU: "menu", STATE_PLAY: "play", STATE_OVER: "over", STATE_WIN: "win"}
 state = STATE_MENU
 
-platforms, goombas, flag, level_width = build_level()
-player = Player(32, 17 * TILE - 56)  # start at left edge on ground
-camera = Camera(level_width)
-
-while True:
-    keys = pygame.key.get_pressed()
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            sys.exit()
-        if event.type == pygame.KEYDOWN:
-            if state == STATE_MENU and event.key == pygame.K_RETURN:
-                platforms, goombas, flag, level_width = build_level()
-                player = Player(32, 17 * TILE - 56)
-                camera = Camera(level_width)
-                state = STATE_PLAY
-            elif state in (STATE_OVER, STATE_WIN) and event.key == pygame.K_RETURN:
-                state = STATE_MENU
-
-    if state == STATE_MENU:
-        screen.fill(SKY)
-        screen.blit(font_big.render("WORLD 1-1", True, WHITE), (260, 200))
-        screen.blit(font_small.render("PRESS ENTER", True, WHITE), (270, 300))
-
-    elif state == STATE_PLAY:
-        player.update(platforms, goombas, flag, keys)
-        camera.update(player)
-        
-        for g in goombas:
-            g.update(platforms)
-            
-        if player.dead:
-            state = STATE_OVER
-        if player.win:
-            state = STATE_WIN
-            
-        screen.fill(SKY)
-        # Draw all platforms except hidden ones
-        for p in platforms:
-            if p.color is not None:
-                pygame.draw.rect(screen, p.color, camera.apply(p.rect))
-            
-        # Draw flag
-        pygame.draw.rect(screen, FLAG_COLOR, camera.apply(flag))
-        pygame.draw.circle(screen, GOLD, camera.apply(flag).topleft, 8)
-        
-        for g in goombas:
-            g.draw(camera)
-            
-        player.draw(camera)
-
-    elif state == STATE_OVER:
-        screen.fill(BLACK)
-        screen.blit(font_big.render("GAME OVER", True, (232,32,32)), (230,250))
-        screen.blit(font_small.render("PRESS ENTER", True, WHITE), (250,320))
-
-    elif state == STATE_WIN:
-        screen.fill(BLACK)
-        screen.blit(font_big.render("YOU CLEARED 1-1!", True, GOLD), (120,250))
-        screen.blit(font_small.render("PRESS ENTER", True, WHITE), (250,320))
-
-    pygame.display.flip()
-    clock.tick(FPS)
+def profile_where():
+    # Profiler thread: game state and camera position, read from the globals below
+    return STATE_NAMES[state], -camera.x
+
+if __name__ == "__main__":
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH,SCREEN_HEIGHT))
+    pygame.display.set_caption("SMB Deluxe – World 1-1 LOCK")
+    clock = pygame.time.Clock()
+
+    font_big = pygame.font.Font(None,72)
+    font_small = pygame.font.Font(None,40)
+    font_tiny = pygame.font.Font(None,24)
+
+    goomba_pool = EntityPool(Goomba)
+    level_cache = LevelCache()
+    platforms, hidden, goombas, flag, level_width, grid, nav = load_level(level_cache.compiled(), goomba_pool)
+    player = Player(*PLAYER_START)
+    camera = Camera(level_width)
+    canvas = Canvas(screen)
+    sections = SectionCache(platforms, level_width)
+    frame_timer = FrameTimer()
+    gc_pacer = GCPacer()
+    gc_pacer.level_built()
+    hud = Hud(font_tiny, font_small, frame_timer, gc_pacer, level_cache, goomba_pool)
+    profiler = SamplingProfiler(profile_where, os.environ["SMB_PROFILE"]) if os.environ.get("SMB_PROFILE") else None
+    recorder = ReplayRecorder(os.environ["SMB_REPLAY_DIR"], level_cache.key) if os.environ.get("SMB_REPLAY_DIR") else None
+
+    while True:
+        frame_start = time.perf_counter()
+        keys = pygame.key.get_pressed()
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                if profiler and profiler.written is None:
+                    profiler.stop()
+                sys.exit()
+            if event.type == pygame.KEYDOWN:
+                if state == STATE_MENU and event.key == pygame.K_RETURN:
+                    # The first level is loaded at startup; later ones were
+                    # preloaded while the end screen and menu were showing
+                    if level_cache.next:
+                        platforms, hidden, goombas, flag, level_width, grid, nav = level_cache.take(goomba_pool)
+                        sections.close()
+                        sections = SectionCache(platforms, level_width)
+                        gc_pacer.level_built()
+                    player = Player(*PLAYER_START)
+                    if recorder:
+                        recorder.start()
+                    camera = Camera(level_width)
+                    state = STATE_PLAY
+                elif state in (STATE_OVER, STATE_WIN) and event.key == pygame.K_RETURN:
+                    state = STATE_MENU
+                if event.key == pygame.K_F2:
+                    canvas.toggle()
+                elif event.key == pygame.K_F9:
+                    if profiler and profiler.written is None:
+                        profiler.stop()
+                    else:
+                        profiler = SamplingProfiler(profile_where)
+
+        if state == STATE_MENU:
+            screen.fill(SKY)
+            screen.blit(font_big.render("WORLD 1-1", True, WHITE), (260, 200))
+            screen.blit(font_small.render("PRESS ENTER", True, WHITE), (270, 300))
+
+        elif state == STATE_PLAY:
+            if recorder:
+                recorder.record(pack_buttons(keys))
+            play_frame(player, keys, platforms, hidden, goombas, flag, grid, nav, sections, goomba_pool)
+            camera.update(player)
+
+            if player.dead:
+                state = STATE_OVER
+            if player.win:
+                state = STATE_WIN
+            if state != STATE_PLAY:
+                if recorder:
+                    recorder.finish()
+                # Round over: start building the restart now
+                goomba_pool.release(goombas)
+                level_cache.preload()
+
+            draw_frame(camera, sections, flag, goombas, player, grid, nav, hud)
+
+        elif state == STATE_OVER:
+            screen.fill(BLACK)
+            screen.blit(font_big.render("GAME OVER", True, (232,32,32)), (230,250))
+            screen.blit(font_small.render("PRESS ENTER", True, WHITE), (250,320))
+
+        elif state == STATE_WIN:
+            screen.fill(BLACK)
+            screen.blit(font_big.render("YOU CLEARED 1-1!", True, GOLD), (120,250))
+            screen.blit(font_small.render("PRESS ENTER", True, WHITE), (250,320))
+
+        if profiler and profiler.written is not None and time.perf_counter() - profiler.written > PROFILE_NOTICE:
+            profiler = None
+        if profiler:
+            screen.blit(font_tiny.render(profiler.text(), True, (232,32,32)), (10, SCREEN_HEIGHT - 24))
+
+        pygame.display.flip()
+
+        # Collections happen here, between frames, and only while playing
+        gc_pacer.set_playing(state == STATE_PLAY)
+        gc_pacer.frame_boundary(1000/FPS - (time.perf_counter() - frame_start) * 1000)
+        clock.tick(FPS)
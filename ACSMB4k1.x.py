@@ -3,6 +3,8 @@
 
 import pygame
 import sys
+import gc
+import time
 import random
 
 pygame.init()
@@ -14,6 +16,8 @@ pygame.init()
 SCREEN_WIDTH, SCREEN_HEIGHT = 800, 600
 FPS = 60
 TILE = 32
+RENDER_SCALE = 2  # low-res render path draws the world at 1/RENDER_SCALE
+GC_DEFER_LIMIT = 120  # frames an old-generation collection may wait for spare frame time
 
 GRAVITY = 0.8
 MAX_FALL = 14
@@ -35,11 +39,120 @@ pygame.display.set_caption("SMB Deluxe – World 1-1 LOCK")
 clock = pygame.time.Clock()
 font_big = pygame.font.Font(None,72)
 font_small = pygame.font.Font(None,40)
+font_tiny = pygame.font.Font(None,24)
 
 # -------------------------------------------------
 # BASIC OBJECTS
 # -------------------------------------------------
 
+class Canvas:
+    # World draw target; in low-res mode draws go to a small surface that is
+    # upscaled into the window once per frame
+    def __init__(self,window):
+        self.window = window
+        self.low = pygame.Surface((SCREEN_WIDTH//RENDER_SCALE,SCREEN_HEIGHT//RENDER_SCALE)).convert()
+        self.set_low_res(False)
+
+    def set_low_res(self,on):
+        self.scale = RENDER_SCALE if on else 1
+        self.surface = self.low if on else self.window
+
+    def toggle(self):
+        self.set_low_res(self.scale == 1)
+
+    def fill(self,color):
+        self.surface.fill(color)
+
+    def rect(self,color,rect):
+        s = self.scale
+        if s == 1:
+            pygame.draw.rect(self.surface,color,rect)
+            return
+        x,y,w,h = rect
+        pygame.draw.rect(self.surface,color,(x//s,y//s,w//s,h//s))
+
+    def circle(self,color,center,radius):
+        s = self.scale
+        pygame.draw.circle(self.surface,color,(center[0]//s,center[1]//s),max(1,radius//s))
+
+    def present(self):
+        if self.scale != 1:
+            pygame.transform.scale(self.low,self.window.get_size(),self.window)
+
+class FrameTimer:
+    # Smoothed world render time (fill + draw + upscale) per render scale
+    def __init__(self):
+        self.ms = {1: 0.0, RENDER_SCALE: 0.0}
+        self.start = 0.0
+
+    def begin(self):
+        self.start = time.perf_counter()
+
+    def end(self,scale):
+        ms = (time.perf_counter() - self.start) * 1000
+        self.ms[scale] += (ms - self.ms[scale]) * 0.1
+
+    def text(self,scale):
+        full,low = self.ms[1],self.ms[RENDER_SCALE]
+        saving = f" ({full/low:.1f}x)" if full and low else ""
+        return f"RES 1/{scale} [F2]  full {full:.2f}ms  low {low:.2f}ms{saving}"
+
+class GCPacer:
+    # Keeps collector pauses out of gameplay frames: the built level is frozen
+    # out of the collector, automatic collection is off while playing and the
+    # young generations are collected between frames. Pauses are timed per
+    # generation through gc.callbacks.
+    def __init__(self):
+        self.last_ms = [0.0,0.0,0.0]
+        self.max_ms = [0.0,0.0,0.0]
+        self.counts = [0,0,0]
+        self.deferred = 0
+        self.start = 0.0
+        gc.callbacks.append(self.on_gc)
+
+    def on_gc(self,phase,info):
+        if phase == "start":
+            self.start = time.perf_counter()
+            return
+        g = info["generation"]
+        ms = (time.perf_counter() - self.start) * 1000
+        self.last_ms[g] = ms
+        self.max_ms[g] = max(self.max_ms[g],ms)
+        self.counts[g] += 1
+
+    def level_built(self):
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+    def set_playing(self,playing):
+        if playing and gc.isenabled():
+            gc.disable()
+        elif not playing and not gc.isenabled():
+            gc.enable()
+
+    def frame_boundary(self,spare_ms):
+        if gc.isenabled():
+            return
+        count = gc.get_count()
+        threshold = gc.get_threshold()
+        gen = -1
+        for g in range(3):
+            if count[g] > threshold[g]:
+                gen = g
+        if gen < 0:
+            return
+        # Older generations wait for a frame with enough spare time, at most GC_DEFER_LIMIT frames
+        if gen > 0 and self.last_ms[gen] > spare_ms and self.deferred < GC_DEFER_LIMIT:
+            self.deferred += 1
+            gen = 0
+        else:
+            self.deferred = 0
+        gc.collect(gen)
+
+    def text(self):
+        return "GC " + "  ".join(f"g{g} x{self.counts[g]} {self.last_ms[g]:.2f}/{self.max_ms[g]:.2f}ms" for g in range(3))
+
 class Block:
     def __init__(self,x,y,w,h,color):
         self.rect = pygame.Rect(x,y,w,h)
@@ -72,15 +185,19 @@ class Goomba:
 
     def draw(self,camera):
         if self.alive:
-            pygame.draw.rect(screen,GOOMBA,camera.apply(self.rect))
+            canvas.rect(GOOMBA,camera.apply(self.rect))
 
 class Camera:
     def __init__(self,width):
         self.x = 0
         self.width = width
+        self.view = pygame.Rect(0,0,0,0)  # reused by apply(), valid until the next call
 
     def apply(self,rect):
-        return rect.move(self.x,0)
+        view = self.view
+        view.update(rect)
+        view.x += self.x
+        return view
 
     def update(self,target):
         self.x = -target.rect.centerx + SCREEN_WIDTH//2
@@ -162,10 +279,10 @@ class Player:
 
     def draw(self,camera):
         r = camera.apply(self.rect)
-        pygame.draw.rect(screen,(232,32,32),(r.x,r.y+20,28,16))
-        pygame.draw.rect(screen,(32,56,236),(r.x+4,r.y+36,8,20))
-        pygame.draw.rect(screen,(32,56,236),(r.x+16,r.y+36,8,20))
-        pygame.draw.rect(screen,(228,188,136),(r.x+4,r.y,20,20))
+        canvas.rect((232,32,32),(r.x,r.y+20,28,16))
+        canvas.rect((32,56,236),(r.x+4,r.y+36,8,20))
+        canvas.rect((32,56,236),(r.x+16,r.y+36,8,20))
+        canvas.rect((228,188,136),(r.x+4,r.y,20,20))
 
 # -------------------------------------------------
 # LEVEL BUILD (FULL 1-1 STYLE)
@@ -207,8 +324,13 @@ state = STATE_MENU
 platforms,goombas,flag,level_width = build_level()
 player = Player(100,100)
 camera = Camera(level_width)
+canvas = Canvas(screen)
+frame_timer = FrameTimer()
+gc_pacer = GCPacer()
+gc_pacer.level_built()
 
 while True:
+    frame_start = time.perf_counter()
     keys = pygame.key.get_pressed()
 
     for event in pygame.event.get():
@@ -217,11 +339,14 @@ while True:
         if event.type == pygame.KEYDOWN:
             if state == STATE_MENU and event.key == pygame.K_RETURN:
                 platforms,goombas,flag,level_width = build_level()
+                gc_pacer.level_built()
                 player = Player(100,100)
                 camera = Camera(level_width)
                 state = STATE_PLAY
             elif state in (STATE_OVER,STATE_WIN) and event.key == pygame.K_RETURN:
                 state = STATE_MENU
+            if event.key == pygame.K_F2:
+                canvas.toggle()
 
     if state == STATE_MENU:
         screen.fill(SKY)
@@ -240,18 +365,23 @@ while True:
         if player.win:
             state = STATE_WIN
 
-        screen.fill(SKY)
+        frame_timer.begin()
+        canvas.fill(SKY)
 
         for p in platforms:
-            pygame.draw.rect(screen,p.color,camera.apply(p.rect))
+            canvas.rect(p.color,camera.apply(p.rect))
 
-        pygame.draw.rect(screen,FLAG_COLOR,camera.apply(flag))
-        pygame.draw.circle(screen,GOLD,camera.apply(flag).topleft,8)
+        canvas.rect(FLAG_COLOR,camera.apply(flag))
+        canvas.circle(GOLD,camera.apply(flag).topleft,8)
 
         for g in goombas:
             g.draw(camera)
 
         player.draw(camera)
+        canvas.present()
+        frame_timer.end(canvas.scale)
+        screen.blit(font_tiny.render(frame_timer.text(canvas.scale),True,WHITE),(10,10))
+        screen.blit(font_tiny.render(gc_pacer.text(),True,WHITE),(10,30))
 
     elif state == STATE_OVER:
         screen.fill(BLACK)
@@ -264,4 +394,8 @@ while True:
         screen.blit(font_small.render("PRESS ENTER",True,WHITE),(250,320))
 
     pygame.display.flip()
+
+    # Collections happen here, between frames, and only while playing
+    gc_pacer.set_playing(state == STATE_PLAY)
+    gc_pacer.frame_boundary(1000/FPS - (time.perf_counter() - frame_start) * 1000)
     clock.tick(FPS)
@@ -0,0 +1,125 @@
+import os
+import sys
+import mmap
+import time
+import multiprocessing
+from array import array
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+import ACCatSMB4K as game
+
+# -------------------------------------------------
+# REPLAY ANALYTICS
+# -------------------------------------------------
+# Resimulates a directory of ACCatSMB4K replays (recorded with
+# SMB_REPLAY_DIR=...) headless on every core and writes per-column
+# histograms of where players die and stomp, plus time to the flag:
+#
+#   python replay_stats.py REPLAY_DIR [OUT_DIR]
+#
+# Each worker memory-maps one replay at a time and returns only a few
+# numbers, so memory stays flat however large the corpus is. Output files
+# are raw little-endian uint32 arrays (array.tofile), one bin per tile
+# column for the x histograms and per second for flag_seconds.u32.
+
+FLAG_BINS = 400  # seconds; slower clears land in the last bin
+CHUNKSIZE = 16  # replays per task handed to a worker
+
+def init_worker():
+    global level_data, goomba_pool, level_key
+    cache = game.LevelCache()
+    level_data = cache.compiled()
+    level_key = cache.key.encode()
+    goomba_pool = game.EntityPool(game.Goomba)
+
+def analyze(path):
+    # -> (same build, outcome, column, frames, stomp columns), or None if not a replay
+    if os.path.getsize(path) < game.REPLAY_HEADER.size:
+        return None
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buttons:
+        magic, key = game.REPLAY_HEADER.unpack_from(buttons, 0)
+        if magic != game.REPLAY_MAGIC:
+            return None
+        if key != level_key:
+            return False, None, None, 0, []
+        platforms, hidden, goombas, flag, width, grid, nav = game.load_level(level_data, goomba_pool)
+        player = game.Player(*game.PLAYER_START)
+        keys = game.ReplayKeys()
+        stomps = []
+        frames = 0
+        fell_at = None  # column where the player dropped out of view; deaths
+                        # are only declared 400px lower, after more drift
+        for frame in range(game.REPLAY_HEADER.size, len(buttons)):
+            keys.buttons = buttons[frame]
+            before = player.stomps
+            game.play_frame(player, keys, platforms, hidden, goombas, flag, grid, nav, None, goomba_pool)
+            frames += 1
+            col = player.rect.centerx // game.TILE
+            stomps.extend([col] * (player.stomps - before))
+            if fell_at is None and player.rect.top > game.SCREEN_HEIGHT:
+                fell_at = col
+            if player.dead or player.win:
+                break
+        goomba_pool.release(goombas)
+
+    col = player.rect.centerx // game.TILE
+    if player.win:
+        outcome = "win"
+    elif player.dead and player.rect.y > 1000:
+        outcome = "pit"
+        col = fell_at
+    elif player.dead:
+        outcome = "goomba"
+    else:
+        outcome = "quit"
+    return True, outcome, col, frames, stomps
+
+def replay_paths(directory):
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(".replay"):
+            yield entry.path
+
+def main(directory, out_dir):
+    cols = game.LevelCache().compiled()["width"] // game.TILE
+    hist = {name: array("I", [0]) * cols for name in ("deaths_pit", "deaths_goomba", "stomps")}
+    flag_seconds = array("I", [0]) * FLAG_BINS
+    counts = {"win": 0, "pit": 0, "goomba": 0, "quit": 0, "other build": 0, "skipped": 0}
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(initializer=init_worker) as workers:
+        for result in workers.imap_unordered(analyze, replay_paths(directory), CHUNKSIZE):
+            if result is None:
+                counts["skipped"] += 1
+                continue
+            same_build, outcome, col, frames, stomps = result
+            if not same_build:
+                # Recorded against another level, so not resimulated or binned
+                counts["other build"] += 1
+                continue
+            counts[outcome] += 1
+            col = min(max(col, 0), cols - 1)
+            if outcome == "win":
+                flag_seconds[min(frames // game.FPS, FLAG_BINS - 1)] += 1
+            elif outcome != "quit":
+                hist["deaths_" + outcome][col] += 1
+            for c in stomps:
+                hist["stomps"][min(max(c, 0), cols - 1)] += 1
+
+    os.makedirs(out_dir, exist_ok=True)
+    for name, data in list(hist.items()) + [("flag_seconds", flag_seconds)]:
+        with open(os.path.join(out_dir, name + ".u32"), "wb") as f:
+            data.tofile(f)
+
+    sessions = counts["win"] + counts["pit"] + counts["goomba"] + counts["quit"]
+    print(f"{sessions} replays in {time.perf_counter() - start:.1f}s  " +
+          "  ".join(f"{k} {v}" for k, v in counts.items()))
+    for name, data in hist.items():
+        top = sorted(range(cols), key=lambda c: -data[c])[:5]
+        print(f"{name:14} top columns: " + ", ".join(f"{c} ({data[c]})" for c in top if data[c]))
+    print(f"written to {out_dir}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python replay_stats.py REPLAY_DIR [OUT_DIR]")
+        sys.exit(1)
+    main(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else "replay-stats")
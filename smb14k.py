@@ -1,16 +1,93 @@
 import pygame
 import sys
+import gc
+import os
+import time
+import queue
+import threading
 import random
+import socket
+import struct
+import zlib
+import asyncio
+import concurrent.futures
+import multiprocessing
+from array import array
+from multiprocessing import shared_memory
+from collections import deque, namedtuple
 
 # ---------- Configuration ----------
 SCREEN_WIDTH, SCREEN_HEIGHT = 800, 600
 FPS = 60
 
+# Low-res render path: world is drawn at 1/RENDER_SCALE and upscaled once per frame
+RENDER_SCALE = 2
+
+# Garbage collection: how many frames an old-generation collection may be
+# postponed because it would not fit in the frame's spare time
+GC_DEFER_LIMIT = 120
+
+# Level grid
+BLOCK = 32
+FLOOR_Y = SCREEN_HEIGHT - 64 # Floor level
+
+# Endless mode: level is generated CHUNK_BLOCKS columns at a time
+ENDLESS_SEED = 1985
+ENDLESS_WIDTH = 1 << 30 # Camera bound, effectively unlimited
+CHUNK_BLOCKS = 16
+CHUNKS_AHEAD = 2 # Chunks kept generated past the right edge of the screen
+CHUNKS_BEHIND = 1 # Chunks kept behind the left edge before being dropped
+INDEXED_MARGIN = 2 # 8-bit mode: cached chunks kept past each side of the view
+
+# Input bitmask, one byte per player per frame
+BUTTON_LEFT = 1
+BUTTON_RIGHT = 2
+BUTTON_JUMP = 4
+
+# Two-player rollback netplay over UDP
+NET_LEVEL_SEED = 11 # Both peers must build the identical level
+NET_INPUT_DELAY = 1 # Frames local input is scheduled ahead, trims rollbacks
+NET_MAX_ROLLBACK = 8 # Simulation stalls rather than predict further than this
+NET_PACKET = struct.Struct("!HiiIiB") # round, ack, hash frame, state hash, first frame, input count
+
+# Split mode: simulation and rendering in separate processes over shared memory
+SPLIT_LEVEL_SEED = 7
+SPLIT_MAX_ENEMIES = 256
+SPLIT_HEADER = struct.Struct("<I") # newest published sequence number
+SPLIT_INPUT = struct.Struct("<BBI") # buttons, command, command sequence
+SPLIT_SLOT = struct.Struct("<IiiBHH") # sequence, frame, camera x, status, players, enemies
+SPLIT_PLAYER = struct.Struct("<iibbBBi") # x, y, facing, legs, dead, win, score
+SPLIT_ENEMY = struct.Struct("<iiB") # x, y, alive
+SPLIT_MAX_PLAYERS = 2
+CMD_NONE, CMD_RESTART, CMD_QUIT = 0, 1, 2
+STATUS_PLAYING, STATUS_WIN, STATUS_DEAD = 0, 1, 2
+
+# Trigger volumes: kinds, and the events a sensor gets each frame
+TRIGGER_PIT, TRIGGER_FLAG = 0, 1
+TRIGGER_ENTER, TRIGGER_STAY, TRIGGER_EXIT = 0, 1, 2
+PIT_TOP = SCREEN_HEIGHT + 2 * BLOCK # A player touching a pit has dropped fully out of view
+PIT_DEPTH = SCREEN_HEIGHT
+
+# Spectators: --spectate PORT serves the session over TCP, --watch HOST:PORT views it
+SPECTATE_KEYFRAME = 60 # Frames between full states; late joiners sync on the next one
+SPECTATE_BACKLOG = 64 * 1024 # Bytes a slow viewer may have queued before it waits for a keyframe
+SPECTATE_FRAME = struct.Struct("<IIBBiBHH") # body length, frame, keyframe, status, camera x, players, enemies, changed
+SPECTATE_ENEMY = struct.Struct("<Hiib") # index, x, y, alive
+
+# Frame capture: F6 or SMB_CAPTURE=png|raw (output in SMB_CAPTURE_DIR)
+CAPTURE_QUEUE = 120 # Frames buffered for the writer before new ones are dropped
+CAPTURE_NOTICE = 4 # Seconds the finished capture's summary stays on the HUD
+CAPTURE_FORMATS = ("png", "raw")
+
 # Physics
 GRAVITY = 0.5
 JUMP_POWER = -14
 PLAYER_SPEED = 6
 FRICTION = 0.85
+MAX_FALL = 12
+
+# Fixed-point physics core: positions and velocities in 1/256 pixel units
+SUBPIXEL_BITS = 8
 
 # Colors
 WHITE = (255, 255, 255)
@@ -19,6 +96,7 @@ SKY_BLUE = (107, 140, 255)
 
 # Mario Palette
 MARIO_RED = (232, 32, 32)
+LUIGI_GREEN = (0, 168, 0)
 MARIO_BLUE = (32, 56, 236)
 MARIO_SKIN = (228, 188, 136)
 MARIO_BROWN = (128, 64, 0)
@@ -33,30 +111,221 @@ BLOCK_GOLD = (248, 184, 0)
 # Enemy Palette
 GOOMBA_BROWN = (180, 90, 30)
 
+FLAG_GRAY = (200, 200, 200)
+
+# 8-bit indexed mode: every color the game draws with gets one palette slot.
+# Themes are alternative palettes over the same indices, so cached 8-bit
+# surfaces change theme with set_palette instead of being redrawn.
+PALETTE = [
+    SKY_BLUE, GROUND_BROWN, BRICK_RED, PIPE_GREEN, PIPE_DARK, BLOCK_GOLD, FLAG_GRAY,
+    BLACK, WHITE, MARIO_RED, MARIO_BLUE, MARIO_SKIN, LUIGI_GREEN, GOOMBA_BROWN,
+]
+KEY_INDEX = 255 # Transparent slot for sprites
+KEY_COLOR = (255, 0, 255)
+
+def make_theme(**colors):
+    # Overworld palette with some slots replaced, padded to 256 entries
+    palette = list(PALETTE)
+    for name, color in colors.items():
+        palette[PALETTE.index(globals()[name])] = color
+    return palette + [KEY_COLOR] * (256 - len(palette))
+
+THEMES = {
+    "OVERWORLD": make_theme(),
+    "UNDERGROUND": make_theme(SKY_BLUE=(0, 0, 0), GROUND_BROWN=(0, 96, 136), BRICK_RED=(0, 136, 136),
+                              PIPE_GREEN=(0, 168, 68), GOOMBA_BROWN=(0, 88, 248)),
+    "NIGHT": make_theme(SKY_BLUE=(16, 20, 64), GROUND_BROWN=(88, 40, 8), BRICK_RED=(110, 48, 16),
+                        PIPE_GREEN=(0, 104, 0), PIPE_DARK=(0, 72, 0), FLAG_GRAY=(120, 120, 140),
+                        GOOMBA_BROWN=(108, 56, 24)),
+}
+
+# HUD
+HUD_SCORE_POS = (20, 20)
+HUD_TIMING_POS = (20, 60)
+HUD_GC_POS = (20, 80)
+HUD_NET_POS = (20, 100)
+HUD_INDEXED_POS = (20, 120)
+HUD_SPECTATE_POS = (20, 140)
+HUD_CAPTURE_POS = (20, SCREEN_HEIGHT - 24)
+
 # ---------- Classes ----------
 
+class Canvas:
+    # Draw target for the world. In low-res mode everything goes to a small
+    # internal surface that is upscaled into the window once per frame.
+    def __init__(self, window):
+        self.window = window
+        self.low = pygame.Surface((SCREEN_WIDTH // RENDER_SCALE, SCREEN_HEIGHT // RENDER_SCALE)).convert()
+        self.size = window.get_size()
+        # Scratch buffers reused by the scaled draw calls
+        self.scratch = pygame.Rect(0, 0, 0, 0)
+        self.points = []
+        self.set_low_res(False)
+
+    def set_low_res(self, on):
+        self.scale = RENDER_SCALE if on else 1
+        self.surface = self.low if on else self.window
+
+    def toggle(self):
+        self.set_low_res(self.scale == 1)
+
+    def fill(self, color):
+        self.surface.fill(color)
+
+    def rect(self, color, rect, width=0):
+        s = self.scale
+        if s == 1:
+            pygame.draw.rect(self.surface, color, rect, width)
+            return
+        x, y, w, h = rect
+        if width:
+            width = max(1, width // s)
+        self.scratch.update(x // s, y // s, w // s, h // s)
+        pygame.draw.rect(self.surface, color, self.scratch, width)
+
+    def circle(self, color, center, radius):
+        s = self.scale
+        pygame.draw.circle(self.surface, color, (center[0] // s, center[1] // s), max(1, radius // s))
+
+    def polygon(self, color, points):
+        s = self.scale
+        if s != 1:
+            buf = self.points
+            if len(buf) != len(points):
+                buf[:] = [[0, 0] for _ in points]
+            for i in range(len(points)):
+                buf[i][0] = points[i][0] // s
+                buf[i][1] = points[i][1] // s
+            points = buf
+        pygame.draw.polygon(self.surface, color, points)
+
+    def blit(self, surface, pos):
+        s = self.scale
+        self.surface.blit(surface, (pos[0] // s, pos[1] // s))
+
+    def present(self):
+        if self.scale != 1:
+            pygame.transform.scale(self.low, self.size, self.window)
+
+class SurfaceCanvas(Canvas):
+    # Canvas over an arbitrary surface at a given scale, used to paint the
+    # cached 8-bit level chunks and sprites with the normal drawing code
+    def __init__(self, surface, scale):
+        self.window = self.surface = surface
+        self.scale = scale
+        self.scratch = pygame.Rect(0, 0, 0, 0)
+        self.points = []
+
+class FrameTimer:
+    # Smoothed world render time (fill + draw + upscale), kept per render scale
+    # so the two paths can be compared side by side in the HUD.
+    def __init__(self):
+        self.ms = {1: 0.0, RENDER_SCALE: 0.0}
+        self.start = 0.0
+        self.frames = 0
+
+    def begin(self):
+        self.start = time.perf_counter()
+
+    def end(self, scale):
+        ms = (time.perf_counter() - self.start) * 1000
+        self.ms[scale] += (ms - self.ms[scale]) * 0.1
+        self.frames += 1
+
+    def text(self, scale):
+        full, low = self.ms[1], self.ms[RENDER_SCALE]
+        saving = f" ({full / low:.1f}x)" if full and low else ""
+        return f"RES 1/{scale} [F2]  full {full:.2f}ms  low {low:.2f}ms{saving}"
+
+class GCPacer:
+    # Keeps collector pauses out of gameplay frames. The built level is frozen
+    # out of the collector, automatic collection is off while playing and the
+    # young generations are collected explicitly between frames. Every pause,
+    # automatic or not, is timed per generation through gc.callbacks.
+    def __init__(self):
+        self.last_ms = [0.0, 0.0, 0.0]
+        self.max_ms = [0.0, 0.0, 0.0]
+        self.counts = [0, 0, 0]
+        self.deferred = 0
+        self.start = 0.0
+        gc.callbacks.append(self.on_gc)
+
+    def on_gc(self, phase, info):
+        if phase == "start":
+            self.start = time.perf_counter()
+            return
+        g = info["generation"]
+        ms = (time.perf_counter() - self.start) * 1000
+        self.last_ms[g] = ms
+        if ms > self.max_ms[g]: self.max_ms[g] = ms
+        self.counts[g] += 1
+
+    def level_built(self):
+        # Release the previous level's frozen objects, then move everything
+        # that survives a full collection into the permanent generation
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+
+    def set_playing(self, playing):
+        if playing and gc.isenabled():
+            gc.disable()
+        elif not playing and not gc.isenabled():
+            gc.enable()
+
+    def frame_boundary(self, spare_ms):
+        if gc.isenabled(): return
+        count = gc.get_count()
+        threshold = gc.get_threshold()
+        gen = -1
+        for g in range(3):
+            if count[g] > threshold[g]: gen = g
+        if gen < 0: return
+
+        # An older generation only runs if its last pause fits in what is
+        # left of this frame, or once it has waited GC_DEFER_LIMIT frames
+        if gen > 0 and self.last_ms[gen] > spare_ms and self.deferred < GC_DEFER_LIMIT:
+            self.deferred += 1
+            gen = 0
+        else:
+            self.deferred = 0
+        gc.collect(gen)
+
+    def text(self):
+        return "GC " + "  ".join(
+            f"g{g} x{self.counts[g]} {self.last_ms[g]:.2f}/{self.max_ms[g]:.2f}ms" for g in range(3))
+
 class Camera:
     def __init__(self, width, height):
         self.camera = pygame.Rect(0, 0, width, height)
         self.width = width
         self.height = height
+        # Shared result rect for apply/apply_rect. Only valid until the next
+        # call, so draw code must use it straight away and not keep it.
+        self.view = pygame.Rect(0, 0, 0, 0)
 
     def apply(self, entity):
-        return entity.rect.move(self.camera.topleft)
+        return self.apply_rect(entity.rect)
 
     def apply_rect(self, rect):
-        return rect.move(self.camera.topleft)
+        view = self.view
+        view.update(rect)
+        view.move_ip(self.camera.x, self.camera.y)
+        return view
 
     def update(self, target):
-        x = -target.rect.centerx + int(SCREEN_WIDTH / 2)
-        y = 0 # Lock Y axis
+        x = -target.rect.centerx + SCREEN_WIDTH // 2
         
         # Limit scrolling to map bounds
         x = min(0, x) # Left side
         x = max(-(self.width - SCREEN_WIDTH), x) # Right side
-        self.camera = pygame.Rect(x, y, self.width, self.height)
+        self.camera.x = x # Y axis stays locked at 0
 
 class Entity(pygame.sprite.Sprite):
+    # Float physics: velocities in pixels/frame, truncated into the rect
+    GRAVITY = GRAVITY
+    MAX_FALL = MAX_FALL
+
     def __init__(self, x, y, w, h):
         super().__init__()
         self.rect = pygame.Rect(x, y, w, h)
@@ -65,21 +334,54 @@ class Entity(pygame.sprite.Sprite):
         self.on_ground = False
         self.facing = 1
 
+    def position(self):
+        return self.rect.x, self.rect.y
+
+    def set_position(self, x, y):
+        self.rect.x, self.rect.y = x, y
+
+    def snapshot(self):
+        x, y = self.position()
+        return (x, y, self.vx, self.vy, self.on_ground, self.facing)
+
+    def restore(self, state):
+        x, y, self.vx, self.vy, self.on_ground, self.facing = state
+        self.set_position(x, y)
+
+    def step_x(self, vx):
+        self.rect.x += int(vx)
+
+    def step_y(self, vy):
+        self.rect.y += int(vy)
+
+    def settle(self):
+        # Hook for cores that track position outside the rect
+        pass
+
+    def damp(self):
+        self.vx *= FRICTION
+
     def apply_gravity(self):
-        self.vy += GRAVITY
-        if self.vy > 12: self.vy = 12
+        self.vy += self.GRAVITY
+        if self.vy > self.MAX_FALL: self.vy = self.MAX_FALL
 
     def move_and_collide(self, platforms):
-        self.rect.x += int(self.vx)
+        self.step_x(self.vx)
         self.collide(platforms, 'x')
+        self.settle()
         
-        self.rect.y += int(self.vy)
+        self.step_y(self.vy)
         self.on_ground = False
         self.collide(platforms, 'y')
+        self.settle()
 
     def collide(self, platforms, axis):
-        hits = [p for p in platforms if self.rect.colliderect(p)]
-        for p in hits:
+        # Test each platform against the rect as it is being resolved, so no
+        # intermediate hit list is built per call
+        rect = self.rect
+        for p in platforms:
+            if not rect.colliderect(p):
+                continue
             if axis == 'x':
                 if self.vx > 0: self.rect.right = p.left
                 elif self.vx < 0: self.rect.left = p.right
@@ -93,55 +395,66 @@ class Entity(pygame.sprite.Sprite):
                     self.rect.top = p.bottom
                     self.vy = 0
 
+PlayerState = namedtuple("PlayerState", "body score walk_frame dead win")
+
 class Player(Entity):
-    def __init__(self, x, y):
+    ACCEL = 0.5
+    SPEED = PLAYER_SPEED
+    REST = 0.1 # Below this speed the player stops dead
+    JUMP = JUMP_POWER
+    BOUNCE = -6
+    ANIM_SPEED = 1 # Legs animate above this speed
+
+    def __init__(self, x, y, shirt=MARIO_RED):
         super().__init__(x, y, 32, 64) # Super Mario Size
         self.hp = 1
         self.score = 0
         self.walk_frame = 0
         self.dead = False
         self.win = False
+        self.shirt = shirt
+
+    def snapshot(self):
+        return PlayerState(super().snapshot(), self.score, self.walk_frame, self.dead, self.win)
 
-    def update(self, platforms, enemies, input_active=True):
+    def restore(self, state):
+        base, self.score, self.walk_frame, self.dead, self.win = state
+        super().restore(base)
+
+    def update(self, platforms, enemies, buttons, input_active=True):
         if self.dead: return
 
-        keys = pygame.key.get_pressed()
-        
         # Movement
         if input_active:
-            if keys[pygame.K_LEFT]:
-                self.vx -= 0.5
+            if buttons & BUTTON_LEFT:
+                self.vx -= self.ACCEL
                 self.facing = -1
                 self.walk_frame += 0.25
-            elif keys[pygame.K_RIGHT]:
-                self.vx += 0.5
+            elif buttons & BUTTON_RIGHT:
+                self.vx += self.ACCEL
                 self.facing = 1
                 self.walk_frame += 0.25
             else:
-                self.vx *= FRICTION
+                self.damp()
                 self.walk_frame = 0
 
             # Jump
-            if keys[pygame.K_SPACE] and self.on_ground:
-                self.vy = JUMP_POWER
+            if buttons & BUTTON_JUMP and self.on_ground:
+                self.vy = self.JUMP
                 self.on_ground = False
         else:
             # Auto-walk logic for cutscenes (optional) or just friction stop
-            self.vx *= FRICTION
+            self.damp()
             self.walk_frame = 0
 
         # Max Speed Cap
-        if self.vx > PLAYER_SPEED: self.vx = PLAYER_SPEED
-        if self.vx < -PLAYER_SPEED: self.vx = -PLAYER_SPEED
-        if abs(self.vx) < 0.1: self.vx = 0
+        if self.vx > self.SPEED: self.vx = self.SPEED
+        if self.vx < -self.SPEED: self.vx = -self.SPEED
+        if abs(self.vx) < self.REST: self.vx = 0
 
         self.apply_gravity()
         self.move_and_collide(platforms)
 
-        # Pit Death
-        if self.rect.y > SCREEN_HEIGHT:
-            self.dead = True
-
         # Enemy Interaction
         if not self.win: # Invincible if won
             player_hitbox = self.rect
@@ -150,52 +463,71 @@ class Player(Entity):
                     # Stomp logic: Moving down and player bottom is above enemy center
                     if self.vy > 0 and self.rect.bottom < enemy.rect.centery + 10:
                         enemy.die()
-                        self.vy = -6 # Bounce
+                        self.vy = self.BOUNCE
                         self.score += 100
                     else:
                         self.dead = True
 
-    def draw(self, surface, camera):
+    def leg_offset(self):
+        if int(self.walk_frame) % 2 == 1 and abs(self.vx) > self.ANIM_SPEED:
+            return 4 # Simple animation
+        return 0
+
+    def draw(self, canvas, camera):
         if self.dead: return 
         
         rect = camera.apply(self)
-        x, y = rect.x, rect.y
-        
+        self.paint(canvas, rect.x, rect.y, self.shirt, self.facing, self.leg_offset())
+
+    @staticmethod
+    def paint(canvas, x, y, color, facing, leg_offset):
         # Simple Pixel Art Representation
-        color = MARIO_RED
         overalls = MARIO_BLUE
         
         # Legs
-        leg_offset = 0
-        if int(self.walk_frame) % 2 == 1 and abs(self.vx) > 1:
-            leg_offset = 4 # Simple animation
-            
-        pygame.draw.rect(surface, overalls, (x + 8 - leg_offset, y + 40, 6, 24)) # Left Leg
-        pygame.draw.rect(surface, overalls, (x + 18 + leg_offset, y + 40, 6, 24)) # Right Leg
+        canvas.rect(overalls, (x + 8 - leg_offset, y + 40, 6, 24)) # Left Leg
+        canvas.rect(overalls, (x + 18 + leg_offset, y + 40, 6, 24)) # Right Leg
         
         # Torso
-        pygame.draw.rect(surface, overalls, (x + 6, y + 24, 20, 16))
+        canvas.rect(overalls, (x + 6, y + 24, 20, 16))
         
         # Arms/Shirt
-        pygame.draw.rect(surface, color, (x, y + 24, 6, 16)) # Left Arm
-        pygame.draw.rect(surface, color, (x + 26, y + 24, 6, 16)) # Right Arm
+        canvas.rect(color, (x, y + 24, 6, 16)) # Left Arm
+        canvas.rect(color, (x + 26, y + 24, 6, 16)) # Right Arm
         
         # Head
-        pygame.draw.rect(surface, MARIO_SKIN, (x + 6, y, 20, 20))
+        canvas.rect(MARIO_SKIN, (x + 6, y, 20, 20))
         
         # Hat
-        pygame.draw.rect(surface, MARIO_RED, (x + 4, y, 24, 6))
-        pygame.draw.rect(surface, MARIO_RED, (x + 4, y-4, 16, 4))
+        canvas.rect(color, (x + 4, y, 24, 6))
+        canvas.rect(color, (x + 4, y-4, 16, 4))
         
         # Eye (Directional)
-        eye_x = x + 20 if self.facing == 1 else x + 8
-        pygame.draw.rect(surface, BLACK, (eye_x, y + 6, 4, 4))
+        eye_x = x + 20 if facing == 1 else x + 8
+        canvas.rect(BLACK, (eye_x, y + 6, 4, 4))
 
 class Enemy(Entity):
+    SPEED = 2
+
     def __init__(self, x, y):
         super().__init__(x, y, 32, 32)
-        self.vx = -2
+        self.spawn(x, y)
+
+    def spawn(self, x, y):
+        # Also used by EntityPool to bring a recycled enemy back to life
+        self.rect.topleft = (x, y)
+        self.vx = -self.SPEED
+        self.vy = 0
+        self.on_ground = False
+        self.facing = 1
         self.alive = True
+
+    def snapshot(self):
+        return (super().snapshot(), self.alive)
+
+    def restore(self, state):
+        base, self.alive = state
+        super().restore(base)
     
     def update(self, platforms):
         if not self.alive: return
@@ -203,15 +535,15 @@ class Enemy(Entity):
         self.apply_gravity()
         
         # Look ahead for walls or edges
-        self.rect.x += int(self.vx)
-        hits = [p for p in platforms if self.rect.colliderect(p)]
-        if hits:
+        self.step_x(self.vx)
+        if self.rect.collidelist(platforms) != -1:
             self.vx *= -1
-            self.rect.x += int(self.vx) # Bounce back
+            self.step_x(self.vx) # Bounce back
         
-        self.rect.y += int(self.vy)
+        self.step_y(self.vy)
         self.on_ground = False
         self.collide(platforms, 'y')
+        self.settle()
 
         if self.rect.y > SCREEN_HEIGHT:
             self.alive = False
@@ -219,30 +551,254 @@ class Enemy(Entity):
     def die(self):
         self.alive = False
 
-    def draw(self, surface, camera):
+    @staticmethod
+    def feet_frame():
+        return (pygame.time.get_ticks() // 200) % 2
+
+    def draw(self, canvas, camera):
         if not self.alive: return
         r = camera.apply(self)
-        pygame.draw.rect(surface, GOOMBA_BROWN, r)
+        self.paint(canvas, r.x, r.y, self.feet_frame())
+
+    @staticmethod
+    def paint(canvas, x, y, feet):
+        canvas.rect(GOOMBA_BROWN, (x, y, 32, 32))
         # Eyes
-        pygame.draw.rect(surface, WHITE, (r.x + 4, r.y + 4, 8, 8))
-        pygame.draw.rect(surface, WHITE, (r.x + 20, r.y + 4, 8, 8))
-        pygame.draw.rect(surface, BLACK, (r.x + 6, r.y + 6, 4, 4))
-        pygame.draw.rect(surface, BLACK, (r.x + 22, r.y + 6, 4, 4))
+        canvas.rect(WHITE, (x + 4, y + 4, 8, 8))
+        canvas.rect(WHITE, (x + 20, y + 4, 8, 8))
+        canvas.rect(BLACK, (x + 6, y + 6, 4, 4))
+        canvas.rect(BLACK, (x + 22, y + 6, 4, 4))
         # Feet animation
-        t = pygame.time.get_ticks()
-        if (t // 200) % 2 == 0:
-            pygame.draw.rect(surface, BLACK, (r.x, r.bottom - 4, 10, 4))
-            pygame.draw.rect(surface, BLACK, (r.x + 22, r.bottom - 4, 10, 4))
+        if feet == 0:
+            canvas.rect(BLACK, (x, y + 28, 10, 4))
+            canvas.rect(BLACK, (x + 22, y + 28, 10, 4))
+
+class EntityPool:
+    # Enemies of one class kept for reuse. Levels spawn from the pool and
+    # hand their enemies back when they are done with them, so restarts and
+    # endless chunks stop allocating once the pool has grown large enough.
+    def __init__(self, cls):
+        self.cls = cls
+        self.free = []
+        self.made = 0
+
+    def spawn(self, x, y):
+        if self.free:
+            e = self.free.pop()
+            e.spawn(x, y)
+            return e
+        self.made += 1
+        return self.cls(x, y)
+
+    def recycle(self, e):
+        self.free.append(e)
+
+    def release(self, entities):
+        self.free.extend(entities)
+        entities.clear()
+
+# ---------- Fixed-Point Physics ----------
+
+def fx(value):
+    # Float constant -> fixed-point subpixel units
+    return int(round(value * (1 << SUBPIXEL_BITS)))
+
+def fx_mul(v, f):
+    # Fixed-point multiply, rounding toward zero so it is symmetric
+    if v >= 0:
+        return v * f >> SUBPIXEL_BITS
+    return -(-v * f >> SUBPIXEL_BITS)
+
+FRICTION_FX = fx(FRICTION)
+
+class FixedPoint:
+    # Mixed in ahead of Player/Enemy. Position and velocity are integers in
+    # 1/256 px; the rect is just the whole-pixel view of the position, so no
+    # float ever enters the simulation and results are bit-exact everywhere.
+    GRAVITY = fx(GRAVITY)
+    MAX_FALL = fx(MAX_FALL)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.px = self.rect.x << SUBPIXEL_BITS
+        self.py = self.rect.y << SUBPIXEL_BITS
+
+    def position(self):
+        return self.px, self.py
+
+    def set_position(self, px, py):
+        self.px, self.py = px, py
+        self.rect.x = px >> SUBPIXEL_BITS
+        self.rect.y = py >> SUBPIXEL_BITS
+
+    def step_x(self, vx):
+        self.px += vx
+        self.rect.x = self.px >> SUBPIXEL_BITS
+
+    def step_y(self, vy):
+        self.py += vy
+        self.rect.y = self.py >> SUBPIXEL_BITS
+
+    def settle(self):
+        # A collision moved the rect: snap the subpixel position onto it
+        if self.rect.x != self.px >> SUBPIXEL_BITS:
+            self.px = self.rect.x << SUBPIXEL_BITS
+        if self.rect.y != self.py >> SUBPIXEL_BITS:
+            self.py = self.rect.y << SUBPIXEL_BITS
+
+    def damp(self):
+        self.vx = fx_mul(self.vx, FRICTION_FX)
+
+class FixedPlayer(FixedPoint, Player):
+    ACCEL = fx(Player.ACCEL)
+    SPEED = fx(Player.SPEED)
+    REST = fx(Player.REST)
+    JUMP = fx(Player.JUMP)
+    BOUNCE = fx(Player.BOUNCE)
+    ANIM_SPEED = fx(Player.ANIM_SPEED)
+
+class FixedEnemy(FixedPoint, Enemy):
+    SPEED = fx(Enemy.SPEED)
+
+    def spawn(self, x, y):
+        super().spawn(x, y)
+        self.px = x << SUBPIXEL_BITS
+        self.py = y << SUBPIXEL_BITS
+
+def state_hash(frame, entities):
+    # CRC of every entity's snapshot, flattened into one array of doubles
+    # (exact for the fixed core's integers and for floats alike). Comparing
+    # this per frame is enough to spot a desync.
+    values = array("d", (frame,))
+    for e in entities:
+        for v in e.snapshot():
+            if type(v) is tuple: values.extend(v)
+            else: values.append(v)
+    return zlib.crc32(values)
+
+# ---------- Triggers ----------
+
+class Trigger:
+    def __init__(self, kind, rect):
+        self.kind = kind
+        self.rect = rect
+
+class TriggerNode:
+    def __init__(self, center, here, left, right):
+        self.center = center
+        self.by_left = sorted(here, key=lambda t: t.rect.left)
+        self.by_right = sorted(here, key=lambda t: -t.rect.right)
+        self.left = left
+        self.right = right
+
+class TriggerTree:
+    # Static centered interval tree over the triggers' x spans, built once
+    # per level. A query visits one node per level of the tree plus the
+    # triggers it actually overlaps, however many the level carries.
+    # sense() tracks what each sensor (a player index) was inside last frame
+    # to report enter / stay / exit events.
+    def __init__(self, triggers):
+        self.triggers = list(triggers)
+        self.root = self.build(self.triggers)
+        self.inside = {}
+        self.spare = set()
+        self.hits = []
+        self.stack = []
+
+    def build(self, items):
+        if not items:
+            return None
+        # Median left edge: the trigger owning it always lands in this node
+        lefts = sorted(t.rect.left for t in items)
+        center = lefts[len(lefts) // 2]
+        here, left, right = [], [], []
+        for t in items:
+            if t.rect.right <= center: left.append(t)
+            elif t.rect.left > center: right.append(t)
+            else: here.append(t)
+        return TriggerNode(center, here, self.build(left), self.build(right))
+
+    def query(self, x0, x1, out):
+        # Appends every trigger whose x span overlaps [x0, x1)
+        stack = self.stack
+        stack.append(self.root)
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            if x1 <= node.center:
+                for t in node.by_left:
+                    if t.rect.left >= x1: break
+                    out.append(t)
+                stack.append(node.left)
+            elif x0 > node.center:
+                for t in node.by_right:
+                    if t.rect.right <= x0: break
+                    out.append(t)
+                stack.append(node.right)
+            else:
+                out.extend(node.by_left)
+                stack.append(node.left)
+                stack.append(node.right)
+
+    def sense(self, key, rect, events):
+        # Refills events with (event, trigger) pairs for this frame
+        events.clear()
+        hits = self.hits
+        hits.clear()
+        self.query(rect.left, rect.right, hits)
+        before = self.inside.get(key)
+        if before is None:
+            before = set()
+        now = self.spare
+        now.clear()
+        for t in hits:
+            if t.rect.colliderect(rect):
+                now.add(t)
+                events.append((TRIGGER_STAY if t in before else TRIGGER_ENTER, t))
+        for t in before:
+            if t not in now:
+                events.append((TRIGGER_EXIT, t))
+        self.inside[key] = now
+        self.spare = before
+
+    def save(self):
+        return tuple((key, tuple(now)) for key, now in self.inside.items())
+
+    def load(self, state):
+        self.inside = {key: set(now) for key, now in state}
+
+def apply_triggers(player, events):
+    for event, trigger in events:
+        if event != TRIGGER_ENTER:
+            continue
+        if trigger.kind == TRIGGER_PIT:
+            player.dead = True
+        elif trigger.kind == TRIGGER_FLAG and not player.win:
+            player.win = True
+            player.vx = 0 # Stop movement
+
+def pit_triggers(segments, width):
+    # One pit under every gap between ground segments, and past both ends
+    edges = [-SCREEN_WIDTH] + [x for seg in segments for x in seg] + [width + SCREEN_WIDTH]
+    pits = []
+    for i in range(0, len(edges), 2):
+        if edges[i + 1] > edges[i]:
+            pits.append(Trigger(TRIGGER_PIT, pygame.Rect(edges[i], PIT_TOP, edges[i + 1] - edges[i], PIT_DEPTH)))
+    return pits
 
 # ---------- Level Generation ----------
 
-def create_level():
+def create_level(seed=None, fixed=False, pool=None):
+    # A seed makes enemy placement reproducible (needed for netplay);
+    # fixed selects the integer subpixel physics core for the enemies.
+    # With a pool (of the matching class) enemies are reused from it.
+    rng = random if seed is None else random.Random(seed)
+    new_enemy = pool.spawn if pool else FixedEnemy if fixed else Enemy
     platforms = []
     enemies = []
     
-    # Scale: 1 Block = 32px
-    BLOCK = 32
-    FLOOR_Y = SCREEN_HEIGHT - 64 # Floor level
+    # Scale: 1 Block = 32px (BLOCK), floor at FLOOR_Y
     
     # 1. The Ground
     segments = [
@@ -267,7 +823,7 @@ def create_level():
         h = h_blocks * BLOCK
         platforms.append(pygame.Rect(px, py, w, h))
         if i % 2 == 0:
-            enemies.append(Enemy(px - 100, FLOOR_Y - 32))
+            enemies.append(new_enemy(px - 100, FLOOR_Y - 32))
 
     # 3. Bricks and Question Blocks
     block_patterns = [
@@ -279,8 +835,8 @@ def create_level():
     for bx, by in block_patterns:
         rect = pygame.Rect(bx * BLOCK, FLOOR_Y - (by * BLOCK), BLOCK, BLOCK)
         platforms.append(rect)
-        if random.random() > 0.8:
-             enemies.append(Enemy(bx * BLOCK, FLOOR_Y - (by * BLOCK) - 40))
+        if rng.random() > 0.8:
+             enemies.append(new_enemy(bx * BLOCK, FLOOR_Y - (by * BLOCK) - 40))
 
     # 4. Staircase
     stair_start = 134
@@ -303,8 +859,1055 @@ def create_level():
     # The actual pole for collision trigger (invisible physics sensor)
     # 9 blocks high, thin
     flag_rect = pygame.Rect(flag_x + 12, FLOOR_Y - 9 * BLOCK, 8, 9 * BLOCK)
+
+    # 6. Trigger volumes
+    width = 200 * BLOCK
+    triggers = pit_triggers([(start * BLOCK, end * BLOCK) for start, end in segments], width)
+    triggers.append(Trigger(TRIGGER_FLAG, flag_rect))
     
-    return platforms, enemies, 200 * BLOCK, flag_rect
+    return platforms, enemies, width, flag_rect, TriggerTree(triggers)
+
+# ---------- Level Drawing ----------
+
+def platform_color(p):
+    if p.width == 64 and p.height >= 64: return PIPE_GREEN
+    if p.width == 32 and p.height == 32 and p.y < SCREEN_HEIGHT - 100: return BRICK_RED
+    return GROUND_BROWN
+
+def paint_platform(canvas, p, rect):
+    # p is the platform in world space, rect where it lands on the canvas
+    color = platform_color(p)
+    canvas.rect(color, rect)
+    canvas.rect(BLACK, rect, 2)
+
+    if color == PIPE_GREEN:
+        canvas.rect(PIPE_DARK, (rect.x, rect.y, rect.width, 30))
+        canvas.rect(BLACK, (rect.x, rect.y, rect.width, 30), 2)
+
+def paint_flag(canvas, pole, points):
+    # points is a caller-owned [[x, y]] * 3 buffer for the flag triangle
+    canvas.rect(FLAG_GRAY, pole) # Gray Pole
+    # Ball on top
+    canvas.circle(BLOCK_GOLD, (pole.centerx, pole.top), 8)
+    # Flag (Triangle)
+    points[0][0] = pole.left
+    points[0][1] = pole.top + 20
+    points[1][0] = pole.left - 40
+    points[1][1] = pole.top + 40
+    points[2][0] = pole.left
+    points[2][1] = pole.top + 60
+    canvas.polygon(MARIO_RED, points)
+
+def draw_world(canvas, camera, platforms, flag_rect, enemies, players, flag_tri):
+    # Level, flag (endless mode has none) and entities; no fill or present
+    for p in platforms:
+        paint_platform(canvas, p, camera.apply_rect(p))
+    if flag_rect:
+        paint_flag(canvas, camera.apply_rect(flag_rect), flag_tri)
+    for e in enemies:
+        e.draw(canvas, camera)
+    for p in players:
+        p.draw(canvas, camera)
+
+# ---------- Indexed Rendering ----------
+
+class IndexedRenderer:
+    # Optional 8-bit render path. The level is cached in CHUNK_BLOCKS-wide
+    # palettized chunks and every sprite pose in a palettized sprite sheet,
+    # a quarter of the memory of 32-bit copies. Changing theme only swaps
+    # the palette on the cached surfaces; no pixel is redrawn.
+    def __init__(self, theme="OVERWORLD"):
+        self.theme = theme
+        self.chunk_width = CHUNK_BLOCKS * BLOCK
+        self.chunks = {} # (chunk index, scale) -> Surface
+        self.sprites = {} # (pose..., scale) -> Surface
+        self.platforms = []
+        self.flag_rect = None
+        self.label = None # HUD text, rebuilt only when the cache changes
+
+    def load(self, platforms, flag_rect):
+        # platforms is kept by reference, so endless mode's live list works
+        self.platforms = platforms
+        self.flag_rect = flag_rect
+        self.chunks.clear()
+        self.label = None
+
+    def new_surface(self, size):
+        surf = pygame.Surface(size, 0, 8)
+        surf.set_palette(THEMES["OVERWORLD"]) # Paint in the base palette...
+        return surf
+
+    def finish(self, surf):
+        surf.set_palette(THEMES[self.theme]) # ...then show the current theme
+        return surf
+
+    def set_theme(self, theme):
+        self.theme = theme
+        self.label = None
+        palette = THEMES[theme]
+        for surf in self.chunks.values(): surf.set_palette(palette)
+        for surf in self.sprites.values(): surf.set_palette(palette)
+
+    def next_theme(self):
+        names = list(THEMES)
+        self.set_theme(names[(names.index(self.theme) + 1) % len(names)])
+
+    def chunk(self, index, scale):
+        surf = self.chunks.get((index, scale))
+        if surf is not None: return surf
+        surf = self.new_surface((self.chunk_width // scale, SCREEN_HEIGHT // scale))
+        surf.fill(SKY_BLUE)
+        canvas = SurfaceCanvas(surf, scale)
+        x0 = index * self.chunk_width
+        for p in self.platforms:
+            if p.right > x0 and p.x < x0 + self.chunk_width:
+                paint_platform(canvas, p, p.move(-x0, 0))
+        # The flag triangle reaches 40px left of the pole
+        flag = self.flag_rect
+        if flag and flag.right > x0 and flag.x - 40 < x0 + self.chunk_width:
+            paint_flag(canvas, flag.move(-x0, 0), [[0, 0], [0, 0], [0, 0]])
+        self.chunks[(index, scale)] = self.finish(surf)
+        self.label = None
+        return surf
+
+    def sprite(self, key, size, paint, *pose):
+        surf = self.sprites.get(key)
+        if surf is not None: return surf
+        scale = key[-1]
+        surf = self.new_surface((size[0] // scale, size[1] // scale))
+        surf.fill(KEY_INDEX)
+        surf.set_colorkey(KEY_INDEX)
+        paint(SurfaceCanvas(surf, scale), *pose)
+        self.sprites[key] = self.finish(surf)
+        self.label = None
+        return surf
+
+    def draw(self, canvas, camera, enemies, players):
+        scale = canvas.scale
+        view_x = -camera.camera.x
+        first = view_x // self.chunk_width
+        last = (view_x + SCREEN_WIDTH - 1) // self.chunk_width
+        for index in range(first, last + 1):
+            canvas.blit(self.chunk(index, scale), (index * self.chunk_width - view_x, 0))
+
+        # Chunks are dropped once they are INDEXED_MARGIN past the view, so
+        # scrolling back and forth near the edge reuses them
+        for key in [k for k in self.chunks if not first - INDEXED_MARGIN <= k[0] <= last + INDEXED_MARGIN]:
+            del self.chunks[key]
+            self.label = None
+
+        feet = Enemy.feet_frame()
+        for e in enemies:
+            if e.alive:
+                r = camera.apply(e)
+                canvas.blit(self.sprite(("enemy", feet, scale), (32, 32), Enemy.paint, 0, 0, feet), r.topleft)
+        for p in players:
+            if p.dead: continue
+            legs = p.leg_offset()
+            # Sprite is painted 4px lower so the hat above the rect fits
+            key = ("player", p.shirt, p.facing, legs, scale)
+            r = camera.apply(p)
+            canvas.blit(self.sprite(key, (32, 68), Player.paint, 0, 4, p.shirt, p.facing, legs), (r.x, r.y - 4))
+
+    def cache_bytes(self):
+        surfaces = list(self.chunks.values()) + list(self.sprites.values())
+        return sum(surf.get_width() * surf.get_height() for surf in surfaces)
+
+    def text(self):
+        if self.label is None:
+            kb = self.cache_bytes() // 1024
+            self.label = f"8-BIT {self.theme} [F4/F5]  cache {kb} KB (32-bit: {kb * 4} KB)"
+        return self.label
+
+# ---------- Endless Mode ----------
+
+class Chunk:
+    def __init__(self, index, x):
+        self.index = index
+        self.x = x
+        self.right = x + CHUNK_BLOCKS * BLOCK
+        self.platforms = []
+        self.enemies = []
+
+def generate_chunks(seed, pool):
+    # Infinite stream of level chunks. All randomness comes from one seeded
+    # Random consumed in chunk order, so a seed always gives the same level.
+    # Enemies come from pool.
+    rng = random.Random(seed)
+    index = 0
+    while True:
+        chunk = Chunk(index, index * CHUNK_BLOCKS * BLOCK)
+        x0 = index * CHUNK_BLOCKS
+
+        # The first chunk is flat ground to land on
+        kind = "flat" if index == 0 else rng.choice(("flat", "pit", "pipe", "bricks", "stairs"))
+
+        # 1. Ground, with a 2-3 block gap for pits. Segments are at least
+        # 3 blocks wide so they never read as pipes when drawn.
+        if kind == "pit":
+            gap_start = rng.randint(5, 8)
+            gap_end = gap_start + rng.randint(2, 3)
+            segments = [(0, gap_start), (gap_end, CHUNK_BLOCKS)]
+        else:
+            segments = [(0, CHUNK_BLOCKS)]
+        for start, end in segments:
+            chunk.platforms.append(pygame.Rect((x0 + start) * BLOCK, FLOOR_Y, (end - start) * BLOCK, 64))
+
+        # 2. Features
+        if kind == "pipe":
+            h_blocks = rng.randint(2, 4)
+            px = (x0 + rng.randint(4, CHUNK_BLOCKS - 4)) * BLOCK
+            chunk.platforms.append(pygame.Rect(px, FLOOR_Y - h_blocks * BLOCK, 2 * BLOCK, h_blocks * BLOCK))
+        elif kind == "bricks":
+            start = rng.randint(2, 7)
+            for bx in range(start, start + rng.randint(3, 6)):
+                chunk.platforms.append(pygame.Rect((x0 + bx) * BLOCK, FLOOR_Y - 4 * BLOCK, BLOCK, BLOCK))
+            if rng.random() > 0.5:
+                bx = start + 1
+                chunk.platforms.append(pygame.Rect((x0 + bx) * BLOCK, FLOOR_Y - 8 * BLOCK, BLOCK, BLOCK))
+        elif kind == "stairs":
+            height = rng.randint(2, 4)
+            start = rng.randint(2, CHUNK_BLOCKS - 2 * height - 1)
+            for i in range(height):
+                for h in range(i + 1):
+                    chunk.platforms.append(pygame.Rect((x0 + start + i) * BLOCK, FLOOR_Y - (h + 1) * BLOCK, BLOCK, BLOCK))
+                    chunk.platforms.append(pygame.Rect((x0 + start + 2 * height - 1 - i) * BLOCK, FLOOR_Y - (h + 1) * BLOCK, BLOCK, BLOCK))
+
+        # 3. Enemies on the first ground segment
+        if index > 0:
+            start, end = segments[0]
+            for _ in range(rng.randint(0, 2)):
+                ex = x0 + rng.randint(start + 1, end - 2)
+                enemy = pool.spawn(ex * BLOCK, FLOOR_Y - 32)
+                if enemy.rect.collidelist(chunk.platforms) == -1: # Not inside a pipe or stair
+                    chunk.enemies.append(enemy)
+                else:
+                    pool.recycle(enemy)
+
+        yield chunk
+        index += 1
+
+class EndlessLevel:
+    # Keeps a fixed window of chunks around the camera. platforms and enemies
+    # are the flat lists the game loop uses; they are refilled in place only
+    # when a chunk is added or dropped, so memory and per-frame cost stay the
+    # same however far the player runs. Enemies of dropped chunks go back to
+    # the pool the generator spawns from.
+    def __init__(self, seed, pool):
+        self.pool = pool
+        self.source = generate_chunks(seed, pool)
+        self.chunks = deque()
+        self.platforms = []
+        self.enemies = []
+        # Chunks never leave gaps wider than a jump, so one kill volume spans the run
+        self.triggers = TriggerTree(pit_triggers([], ENDLESS_WIDTH))
+        self.update(0)
+
+    def update(self, view_x):
+        changed = False
+        while not self.chunks or self.chunks[-1].right < view_x + SCREEN_WIDTH + CHUNKS_AHEAD * CHUNK_BLOCKS * BLOCK:
+            self.chunks.append(next(self.source))
+            changed = True
+        while self.chunks[0].right < view_x - CHUNKS_BEHIND * CHUNK_BLOCKS * BLOCK:
+            self.pool.release(self.chunks.popleft().enemies)
+            changed = True
+        if changed:
+            self.rebuild()
+
+    def rebuild(self):
+        # Back wall at the left edge of the oldest chunk kept
+        self.platforms[:] = [pygame.Rect(self.chunks[0].x - BLOCK, 0, BLOCK, FLOOR_Y)]
+        self.enemies[:] = []
+        for chunk in self.chunks:
+            self.platforms.extend(chunk.platforms)
+            self.enemies.extend(e for e in chunk.enemies if e.alive)
+
+    def release(self):
+        # The run is over: every enemy still held goes back to the pool
+        for chunk in self.chunks:
+            self.pool.release(chunk.enemies)
+        self.enemies.clear()
+
+# ---------- Input ----------
+
+def read_input():
+    # Keyboard state packed into the button bitmask the simulation consumes
+    keys = pygame.key.get_pressed()
+    buttons = 0
+    if keys[pygame.K_LEFT]: buttons |= BUTTON_LEFT
+    if keys[pygame.K_RIGHT]: buttons |= BUTTON_RIGHT
+    if keys[pygame.K_SPACE]: buttons |= BUTTON_JUMP
+    return buttons
+
+# ---------- Simulation ----------
+
+class World:
+    # One level stepped purely from per-player button bitmasks. Nothing here
+    # depends on the camera, the clock or the keyboard, so two peers fed the
+    # same inputs stay in lockstep, and save/load make rollback possible.
+    def __init__(self, seed, player_count, fixed=False):
+        self.platforms, self.enemies, self.width, self.flag_rect, self.triggers = create_level(seed, fixed)
+        shirts = (MARIO_RED, LUIGI_GREEN)
+        player_cls = FixedPlayer if fixed else Player
+        self.players = [player_cls(100 + 48 * i, 100, shirts[i % 2]) for i in range(player_count)]
+        self.frame = 0
+        self.events = []
+
+    def step(self, inputs):
+        for i, (player, buttons) in enumerate(zip(self.players, inputs)):
+            player.update(self.platforms, self.enemies, buttons, not player.win)
+            self.triggers.sense(i, player.rect, self.events)
+            apply_triggers(player, self.events)
+
+        # Enemies wake up near any player, independent of who is watching
+        for e in self.enemies:
+            for player in self.players:
+                if abs(e.rect.x - player.rect.x) < SCREEN_WIDTH:
+                    e.update(self.platforms)
+                    break
+        self.frame += 1
+
+    def save(self):
+        return (self.frame, tuple(p.snapshot() for p in self.players), tuple(e.snapshot() for e in self.enemies),
+                self.triggers.save())
+
+    def load(self, state):
+        self.frame, players, enemies, triggers = state
+        self.triggers.load(triggers)
+        for p, s in zip(self.players, players): p.restore(s)
+        for e, s in zip(self.enemies, enemies): e.restore(s)
+
+    def state_hash(self):
+        return state_hash(self.frame, self.players + self.enemies)
+
+# ---------- Netplay ----------
+
+class UdpChannel:
+    # Non-blocking UDP link to one peer. delay (frames) and loss (0..1) are
+    # artificial network conditions for testing on localhost.
+    def __init__(self, local_port, peer, delay=0, loss=0.0, seed=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", local_port))
+        self.sock.setblocking(False)
+        self.peer = peer
+        self.delay = delay
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.outbox = deque() # (release tick, packet)
+        self.ticks = 0
+        self.sent_bytes = 0
+
+    def send(self, packet):
+        if self.loss and self.rng.random() < self.loss: return
+        self.outbox.append((self.ticks + self.delay, packet))
+
+    def flush(self):
+        while self.outbox and self.outbox[0][0] <= self.ticks:
+            packet = self.outbox.popleft()[1]
+            try:
+                self.sock.sendto(packet, self.peer)
+                self.sent_bytes += len(packet)
+            except OSError:
+                pass # Peer not up yet; the inputs are resent next frame
+        self.ticks += 1
+
+    def receive(self):
+        while True:
+            try:
+                packet, _ = self.sock.recvfrom(512)
+            except (BlockingIOError, ConnectionResetError):
+                return
+            yield packet
+
+    def close(self):
+        self.sock.close()
+
+class RollbackSession:
+    # Two-player rollback over a UdpChannel. Every frame the local input is
+    # scheduled NET_INPUT_DELAY frames ahead and all unacknowledged local
+    # inputs are sent, so a lost packet is covered by the next one. The
+    # remote player's missing inputs are predicted as "same as last known";
+    # when a real input arrives that differs, the world is restored to the
+    # snapshot of that frame and resimulated up to the present. Both peers
+    # count rounds the same way, and packets from any other round (a peer
+    # still on the end screen of the last one) are dropped.
+    def __init__(self, world, local_index, channel, round_id=0):
+        self.world = world
+        self.round_id = round_id & 0xFFFF
+        self.local = local_index
+        self.remote = 1 - local_index
+        self.channel = channel
+        self.inputs = ({}, {})
+        for f in range(NET_INPUT_DELAY):
+            self.inputs[self.local][f] = 0
+        self.snapshots = {}
+        self.predicted = {} # frame -> remote input guessed when it was simulated
+        self.remote_confirmed = -1 # newest frame with all remote inputs up to it
+        self.last_remote = 0
+        self.peer_ack = -1 # newest local input frame the peer has confirmed
+        self.rollback_from = None
+        self.rollbacks = 0
+        self.resimulated = 0
+        self.stalled = False
+        self.hashes = {} # frame -> state hash after that frame was (re)simulated
+        self.peer_hash = (-1, 0) # newest (frame, hash) reported by the peer
+        self.desync_frame = None
+
+    def tick(self, buttons):
+        self.receive()
+        if self.rollback_from is not None:
+            current = self.world.frame
+            self.world.load(self.snapshots[self.rollback_from])
+            for f in range(self.rollback_from, current):
+                self.simulate(f)
+                self.resimulated += 1
+            self.rollbacks += 1
+            self.rollback_from = None
+        self.check_desync()
+
+        # Never run further ahead of the peer than snapshots can undo
+        frame = self.world.frame
+        self.stalled = frame - self.remote_confirmed > NET_MAX_ROLLBACK
+        if not self.stalled:
+            self.inputs[self.local][frame + NET_INPUT_DELAY] = buttons
+            self.simulate(frame)
+            self.prune()
+        self.send()
+        return not self.stalled
+
+    def idle(self):
+        # Keep the link alive after the round ends so the peer can confirm
+        self.receive()
+        self.check_desync()
+        self.send()
+
+    def check_desync(self):
+        # Hashes of frames up to remote_confirmed are final once any pending
+        # rollback has been applied, so a mismatch there is a real desync
+        frame, peer_hash = self.peer_hash
+        mine = self.hashes.get(frame)
+        if frame <= self.remote_confirmed and mine is not None and mine != peer_hash:
+            if self.desync_frame is None:
+                self.desync_frame = frame
+
+    def outcome(self):
+        # Round result as of the newest frame simulated from real remote
+        # inputs only. Predicted frames never end the round, but the peer
+        # running ahead need not wait for its own prediction to run out.
+        frame = self.remote_confirmed + 1
+        if frame >= self.world.frame:
+            players = self.world.players
+        else:
+            players = self.snapshots[frame][1]
+        if any(p.win for p in players):
+            return STATUS_WIN
+        if all(p.dead for p in players):
+            return STATUS_DEAD
+        return STATUS_PLAYING
+
+    def simulate(self, frame):
+        self.snapshots[frame] = self.world.save()
+        remote = self.inputs[self.remote].get(frame)
+        if remote is None:
+            remote = self.last_remote
+            self.predicted[frame] = remote
+        inputs = [0, 0]
+        inputs[self.local] = self.inputs[self.local][frame]
+        inputs[self.remote] = remote
+        self.world.step(inputs)
+        self.hashes[frame] = self.world.state_hash()
+
+    def receive(self):
+        for packet in self.channel.receive():
+            if len(packet) < NET_PACKET.size: continue
+            round_id, ack, hash_frame, peer_hash, first, count = NET_PACKET.unpack_from(packet)
+            if round_id != self.round_id: continue
+            self.peer_ack = max(self.peer_ack, ack)
+            if hash_frame > self.peer_hash[0]:
+                self.peer_hash = (hash_frame, peer_hash)
+            bits = packet[NET_PACKET.size:NET_PACKET.size + count]
+            for i, b in enumerate(bits):
+                frame = first + i
+                if frame != self.remote_confirmed + 1: continue
+                self.inputs[self.remote][frame] = b
+                self.remote_confirmed = frame
+                self.last_remote = b
+                guess = self.predicted.pop(frame, None)
+                if guess is not None and guess != b:
+                    if self.rollback_from is None or frame < self.rollback_from:
+                        self.rollback_from = frame
+
+    def send(self):
+        first = self.peer_ack + 1
+        last = self.world.frame - 1 + NET_INPUT_DELAY
+        local = self.inputs[self.local]
+        bits = bytes(local[f] for f in range(first, last + 1))
+        hash_frame = min(self.remote_confirmed, self.world.frame - 1)
+        if hash_frame not in self.hashes: hash_frame = -1
+        header = NET_PACKET.pack(self.round_id, self.remote_confirmed, hash_frame, self.hashes.get(hash_frame, 0), first, len(bits))
+        self.channel.send(header + bits)
+        self.channel.flush()
+
+    def prune(self):
+        # Snapshots and inputs are only needed back to the oldest frame a
+        # rollback can reach; local inputs also until the peer has them
+        oldest = min(self.remote_confirmed + 1, self.world.frame - NET_MAX_ROLLBACK)
+        for f in [f for f in self.snapshots if f < oldest]:
+            del self.snapshots[f]
+            self.inputs[self.remote].pop(f, None)
+        for f in [f for f in self.hashes if f < oldest - NET_MAX_ROLLBACK]:
+            del self.hashes[f]
+        keep = min(oldest, self.peer_ack + 1)
+        for f in [f for f in self.inputs[self.local] if f < keep]:
+            del self.inputs[self.local][f]
+
+    def text(self):
+        wait = "  WAITING FOR PEER" if self.stalled else ""
+        if self.desync_frame is not None:
+            wait += f"  DESYNC AT {self.desync_frame}"
+        return f"NET frame {self.world.frame} remote {self.remote_confirmed} rollbacks {self.rollbacks} resim {self.resimulated}{wait}"
+
+def parse_coop_args(argv):
+    # smb14k.py --coop LOCAL_PORT PEER_HOST:PEER_PORT PLAYER(1|2) [--delay FRAMES] [--loss 0..1]
+    if len(argv) < 4 or argv[0] != "--coop":
+        return None
+    host, port = argv[2].rsplit(":", 1)
+    delay = int(argv[argv.index("--delay") + 1]) if "--delay" in argv else 0
+    loss = float(argv[argv.index("--loss") + 1]) if "--loss" in argv else 0.0
+    return int(argv[1]), (host, int(port)), int(argv[3]) - 1, delay, loss
+
+# ---------- Split Simulation / Render ----------
+
+class SharedState:
+    # Shared-memory block written by the simulation process and read by the
+    # render process. It holds the render side's input and two state slots.
+    # The writer fills the slot the reader is not looking at, then publishes
+    # its sequence number; each slot carries that number too (0 while being
+    # written), so a reader that raced a writer sees the mismatch and reads
+    # the other slot. Nothing is pickled; values are packed in place.
+    def __init__(self, name=None):
+        self.slot_size = (SPLIT_SLOT.size + SPLIT_MAX_PLAYERS * SPLIT_PLAYER.size
+                          + SPLIT_MAX_ENEMIES * SPLIT_ENEMY.size)
+        self.input_at = SPLIT_HEADER.size
+        self.slots_at = self.input_at + SPLIT_INPUT.size
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=self.slots_at + 2 * self.slot_size)
+        self.name = self.shm.name
+        self.buf = self.shm.buf
+        self.owner = create
+        if create:
+            self.buf[:self.slots_at + 2 * self.slot_size] = bytes(self.slots_at + 2 * self.slot_size)
+        self.seq = 0
+
+    # Render side -> simulation
+    def write_input(self, buttons, command, command_seq):
+        SPLIT_INPUT.pack_into(self.buf, self.input_at, buttons, command, command_seq)
+
+    def read_input(self):
+        return SPLIT_INPUT.unpack_from(self.buf, self.input_at)
+
+    # Simulation -> render side
+    def publish(self, frame, camera_x, status, players, enemies):
+        if len(enemies) > SPLIT_MAX_ENEMIES or len(players) > SPLIT_MAX_PLAYERS:
+            raise ValueError("level has more entities than the shared state holds")
+        seq = self.seq + 1
+        at = self.slots_at + (seq % 2) * self.slot_size
+        buf = self.buf
+        SPLIT_SLOT.pack_into(buf, at, 0, frame, camera_x, status, len(players), len(enemies))
+        offset = at + SPLIT_SLOT.size
+        for p in players:
+            SPLIT_PLAYER.pack_into(buf, offset, p.rect.x, p.rect.y, p.facing, p.leg_offset(), p.dead, p.win, p.score)
+            offset += SPLIT_PLAYER.size
+        offset = at + SPLIT_SLOT.size + SPLIT_MAX_PLAYERS * SPLIT_PLAYER.size
+        for e in enemies:
+            SPLIT_ENEMY.pack_into(buf, offset, e.rect.x, e.rect.y, e.alive)
+            offset += SPLIT_ENEMY.size
+        SPLIT_SLOT.pack_into(buf, at, seq, frame, camera_x, status, len(players), len(enemies))
+        SPLIT_HEADER.pack_into(buf, 0, seq)
+        self.seq = seq
+
+    def read_into(self, players, enemies):
+        # Copies the newest complete slot onto the render-side view objects.
+        # Returns (frame, camera x, status), or None before the first publish.
+        buf = self.buf
+        for _ in range(4):
+            seq = SPLIT_HEADER.unpack_from(buf, 0)[0]
+            if seq == 0: return None
+            at = self.slots_at + (seq % 2) * self.slot_size
+            slot_seq, frame, camera_x, status, n_players, n_enemies = SPLIT_SLOT.unpack_from(buf, at)
+            if slot_seq != seq: continue
+            offset = at + SPLIT_SLOT.size
+            for p in players[:n_players]:
+                x, y, p.facing, p.legs, dead, win, p.score = SPLIT_PLAYER.unpack_from(buf, offset)
+                p.rect.x, p.rect.y, p.dead, p.win = x, y, bool(dead), bool(win)
+                offset += SPLIT_PLAYER.size
+            offset = at + SPLIT_SLOT.size + SPLIT_MAX_PLAYERS * SPLIT_PLAYER.size
+            for e in enemies[:n_enemies]:
+                x, y, alive = SPLIT_ENEMY.unpack_from(buf, offset)
+                e.rect.x, e.rect.y, e.alive = x, y, bool(alive)
+                offset += SPLIT_ENEMY.size
+            if SPLIT_SLOT.unpack_from(buf, at)[0] == seq: # Not overwritten meanwhile
+                return frame, camera_x, status
+        return None
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+class PlayerView(Player):
+    # Render-side stand-in for a simulated player; the leg pose comes from
+    # the shared state instead of being derived from velocity
+    def __init__(self, x, y, shirt=MARIO_RED):
+        super().__init__(x, y, shirt)
+        self.legs = 0
+
+    def leg_offset(self):
+        return self.legs
+
+def run_simulation(name, seed, frames=None):
+    # Simulation process: steps a World at FPS and publishes every frame.
+    # Needs no display, so it also runs with no renderer attached.
+    state = SharedState(name)
+    world = World(seed, 1)
+    camera = Camera(world.width, SCREEN_HEIGHT)
+    last_command = 0
+    ticks = 0
+    next_tick = time.perf_counter()
+    try:
+        while frames is None or ticks < frames:
+            ticks += 1
+            buttons, command, command_seq = state.read_input()
+            if command_seq != last_command:
+                last_command = command_seq
+                if command == CMD_QUIT: break
+                if command == CMD_RESTART:
+                    world = World(seed, 1)
+
+            player = world.players[0]
+            if not player.dead and not player.win:
+                world.step([buttons])
+            camera.update(player)
+            status = STATUS_WIN if player.win else STATUS_DEAD if player.dead else STATUS_PLAYING
+            state.publish(world.frame, camera.camera.x, status, world.players, world.enemies)
+
+            next_tick += 1 / FPS
+            delay = next_tick - time.perf_counter()
+            if delay > 0: time.sleep(delay)
+            else: next_tick = time.perf_counter() # Fell behind; don't try to catch up
+    finally:
+        state.close()
+    return world
+
+def main_split():
+    # Render process: owns the window and keyboard, starts the simulation
+    # process and draws whatever state it published last
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Super Mario Python 1-1 (split)")
+    clock = pygame.time.Clock()
+    canvas = Canvas(screen)
+    font_main = pygame.font.Font(None, 40)
+    font_small = pygame.font.Font(None, 24)
+
+    state = SharedState()
+    sim = multiprocessing.Process(target=run_simulation, args=(state.name, SPLIT_LEVEL_SEED), daemon=True)
+    sim.start()
+
+    # Same seed -> same level and enemy order as the simulation's World
+    platforms, enemies, level_width, flag_rect, _ = create_level(SPLIT_LEVEL_SEED)
+    players = [PlayerView(100, 100)]
+    camera = Camera(level_width, SCREEN_HEIGHT)
+    flag_tri = [[0, 0], [0, 0], [0, 0]]
+    command, command_seq = CMD_NONE, 0
+
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F2:
+                    canvas.toggle()
+                elif event.key == pygame.K_RETURN:
+                    command, command_seq = CMD_RESTART, command_seq + 1
+        state.write_input(read_input(), command, command_seq)
+
+        published = state.read_into(players, enemies)
+        canvas.fill(SKY_BLUE)
+        if published:
+            frame, camera.camera.x, status = published
+            draw_world(canvas, camera, platforms, flag_rect, enemies, players, flag_tri)
+        canvas.present()
+
+        if published:
+            hud = f"SCORE: {players[0].score}"
+            if status == STATUS_WIN: hud += "   COURSE CLEAR! (ENTER)"
+            elif status == STATUS_DEAD: hud += "   GAME OVER (ENTER)"
+            screen.blit(font_main.render(hud, True, WHITE), HUD_SCORE_POS)
+            screen.blit(font_small.render(f"SIM frame {frame}  RENDER {clock.get_fps():.0f} fps", True, WHITE), HUD_TIMING_POS)
+
+        pygame.display.flip()
+        clock.tick(FPS)
+
+    state.write_input(0, CMD_QUIT, command_seq + 1)
+    sim.join(1)
+    state.close()
+    pygame.quit()
+    sys.exit()
+
+# ---------- Frame Capture ----------
+
+class FrameCapture:
+    # Records the display from the game loop without stalling it. Each frame
+    # is copied once (pygame.image.tobytes) into a bounded queue; a writer
+    # thread encodes PNGs or appends to one raw RGB stream. When the writer
+    # falls behind the queue fills up and frames are dropped and counted.
+    # Stopping never waits: the writer drains what is queued on its own.
+    def __init__(self, size, fmt="png", directory=None):
+        self.size = size
+        self.fmt = fmt
+        self.directory = directory or time.strftime("capture-%Y%m%d-%H%M%S")
+        os.makedirs(self.directory, exist_ok=True)
+        self.frames = queue.Queue(maxsize=CAPTURE_QUEUE)
+        self.captured = 0
+        self.dropped = 0
+        self.written = 0
+        self.stopping = threading.Event()
+        self.finished = None # perf_counter time the writer wrote its last frame
+        self.writer = threading.Thread(target=self.write_frames, name="capture-writer", daemon=True)
+        self.writer.start()
+
+    def capture(self, surface):
+        index = self.captured + self.dropped
+        try:
+            self.frames.put_nowait((index, pygame.image.tobytes(surface, "RGB")))
+            self.captured += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def write_frames(self):
+        raw = open(os.path.join(self.directory, "frames.rgb"), "wb") if self.fmt == "raw" else None
+        while True:
+            try:
+                index, data = self.frames.get(timeout=0.05)
+            except queue.Empty:
+                if self.stopping.is_set(): break
+                continue
+            if raw:
+                raw.write(data)
+            else:
+                image = pygame.image.frombytes(data, self.size, "RGB")
+                pygame.image.save(image, os.path.join(self.directory, f"frame{index:06d}.png"))
+            self.written += 1
+        if raw: raw.close()
+        # Summary next to the frames
+        with open(os.path.join(self.directory, "capture.txt"), "w") as f:
+            f.write(f"format {self.fmt}\nsize {self.size[0]}x{self.size[1]}\nfps {FPS}\n")
+            f.write(f"written {self.written}\ndropped {self.dropped}\n")
+        self.finished = time.perf_counter()
+
+    def stop(self):
+        self.stopping.set()
+
+    def text(self):
+        if self.finished is not None:
+            return f"SAVED {self.written} frames  {self.dropped} dropped -> {self.directory}"
+        if self.stopping.is_set():
+            return f"SAVING {self.written}/{self.captured} frames -> {self.directory}"
+        return f"REC {self.captured} frames  {self.dropped} dropped  queue {self.frames.qsize()}"
+
+def capture_from_env(size):
+    fmt = os.environ.get("SMB_CAPTURE")
+    if not fmt: return None
+    if fmt not in CAPTURE_FORMATS:
+        sys.exit(f"SMB_CAPTURE must be one of {', '.join(CAPTURE_FORMATS)}, not {fmt!r}")
+    return FrameCapture(size, fmt, os.environ.get("SMB_CAPTURE_DIR"))
+
+# ---------- Spectators ----------
+
+class SpectatorServer:
+    # Broadcasts the session to TCP viewers from an asyncio loop on its own
+    # thread. publish() runs on the game thread: it encodes the players and
+    # only the enemies that changed since the previous frame, then hands the
+    # message to the loop thread without touching a socket. Every
+    # SPECTATE_KEYFRAME frames all enemies are sent; new viewers, and viewers
+    # too slow to drain their backlog, skip ahead to the next keyframe.
+    def __init__(self, port, host="0.0.0.0"):
+        self.loop = asyncio.new_event_loop()
+        self.clients = {} # writer -> in sync (has seen a keyframe since joining or lagging)
+        self.last = array("i") # x, y, alive of every enemy as last sent
+        self.frame = 0
+        self.sent = 0 # Size of the last message
+        self.message = bytearray()
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self.run, args=(host, port), name="spectate", daemon=True)
+        self.thread.start()
+        self.started.wait()
+
+    def run(self, host, port):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.accept, host, port))
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.close()
+
+    async def accept(self, reader, writer):
+        self.clients[writer] = False
+        try:
+            while await reader.read(1024): # Viewers send nothing; this waits for hang-up
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+
+    def publish(self, status, camera_x, players, enemies):
+        if not self.clients:
+            # Nobody to send to. Forgetting the enemies makes the next
+            # message a keyframe, so the first viewer syncs at once.
+            del self.last[:]
+            self.sent = 0
+            self.frame += 1
+            return
+        last = self.last
+        keyframe = self.frame % SPECTATE_KEYFRAME == 0 or len(last) != 3 * len(enemies)
+        if len(last) != 3 * len(enemies):
+            last[:] = array("i", [0]) * (3 * len(enemies))
+        message = self.message
+        del message[:]
+        message += bytes(SPECTATE_FRAME.size)
+        for p in players:
+            message += SPLIT_PLAYER.pack(p.rect.x, p.rect.y, p.facing, p.leg_offset(), p.dead, p.win, p.score)
+        changed = 0
+        for i, e in enumerate(enemies):
+            x, y, alive = e.rect.x, e.rect.y, int(e.alive)
+            at = 3 * i
+            if keyframe or last[at] != x or last[at + 1] != y or last[at + 2] != alive:
+                last[at], last[at + 1], last[at + 2] = x, y, alive
+                message += SPECTATE_ENEMY.pack(i, x, y, alive)
+                changed += 1
+        SPECTATE_FRAME.pack_into(message, 0, len(message) - SPECTATE_FRAME.size, self.frame, keyframe,
+                                 status, camera_x, len(players), len(enemies), changed)
+        self.sent = len(message)
+        self.frame += 1
+        self.loop.call_soon_threadsafe(self.broadcast, bytes(message), keyframe)
+
+    def broadcast(self, message, keyframe):
+        # Loop thread. write() only queues; a viewer that lets too much pile
+        # up misses deltas until the next keyframe instead of stalling anyone.
+        for writer, synced in list(self.clients.items()):
+            if writer.is_closing():
+                continue
+            if writer.transport.get_write_buffer_size() > SPECTATE_BACKLOG:
+                self.clients[writer] = False
+                continue
+            if synced or keyframe:
+                writer.write(message)
+                self.clients[writer] = True
+
+    async def shutdown(self):
+        # Closing each connection ends its accept() task with EOF
+        self.server.close()
+        for writer in list(self.clients):
+            writer.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def close(self):
+        # Viewers get a second to hang up; the loop is stopped either way
+        try:
+            asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(1)
+        except concurrent.futures.TimeoutError:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(1)
+
+    def text(self):
+        return f"SPECTATE {len(self.clients)} viewers  {self.sent} B/frame"
+
+class SpectatorFeed:
+    # Viewer side: rebuilds players and enemies from the byte stream.
+    # Deltas are ignored until the first keyframe arrives.
+    def __init__(self):
+        self.buffer = bytearray()
+        self.players = []
+        self.enemies = []
+        self.synced = False
+        self.frame = 0
+        self.status = STATUS_PLAYING
+        self.camera_x = 0
+
+    def feed(self, data):
+        buf = self.buffer
+        buf += data
+        at = 0
+        while len(buf) - at >= SPECTATE_FRAME.size:
+            length, frame, keyframe, status, camera_x, n_players, n_enemies, changed = SPECTATE_FRAME.unpack_from(buf, at)
+            end = at + SPECTATE_FRAME.size + length
+            if len(buf) < end:
+                break
+            if keyframe or self.synced:
+                self.synced = True
+                self.frame, self.status, self.camera_x = frame, status, camera_x
+                self.apply(buf, at + SPECTATE_FRAME.size, n_players, n_enemies, changed)
+            at = end
+        del buf[:at]
+
+    def apply(self, buf, offset, n_players, n_enemies, changed):
+        while len(self.players) < n_players:
+            self.players.append(PlayerView(0, 0, (MARIO_RED, LUIGI_GREEN)[len(self.players) % 2]))
+        del self.players[n_players:]
+        for p in self.players:
+            x, y, p.facing, p.legs, dead, win, p.score = SPLIT_PLAYER.unpack_from(buf, offset)
+            p.rect.x, p.rect.y, p.dead, p.win = x, y, bool(dead), bool(win)
+            offset += SPLIT_PLAYER.size
+        while len(self.enemies) < n_enemies:
+            self.enemies.append(Enemy(0, 0))
+        del self.enemies[n_enemies:]
+        for _ in range(changed):
+            i, x, y, alive = SPECTATE_ENEMY.unpack_from(buf, offset)
+            e = self.enemies[i]
+            e.rect.x, e.rect.y, e.alive = x, y, bool(alive)
+            offset += SPECTATE_ENEMY.size
+
+def parse_spectate_args(argv):
+    # smb14k.py [...] --spectate PORT
+    if "--spectate" not in argv:
+        return None
+    return int(argv[argv.index("--spectate") + 1])
+
+def main_watch(address):
+    # Viewer window: draws the 1-1 course under whatever the server sends
+    host, port = address.rsplit(":", 1)
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Super Mario Python 1-1 (spectating)")
+    clock = pygame.time.Clock()
+    canvas = Canvas(screen)
+    font_main = pygame.font.Font(None, 40)
+    font_small = pygame.font.Font(None, 24)
+
+    sock = socket.create_connection((host, int(port)))
+    sock.setblocking(False)
+    feed = SpectatorFeed()
+    platforms, _, level_width, flag_rect, _ = create_level()
+    camera = Camera(level_width, SCREEN_HEIGHT)
+    flag_tri = [[0, 0], [0, 0], [0, 0]]
+
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                canvas.toggle()
+        try:
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    running = False
+                    break
+                feed.feed(data)
+        except BlockingIOError:
+            pass
+
+        canvas.fill(SKY_BLUE)
+        if feed.synced:
+            camera.camera.x = feed.camera_x
+            draw_world(canvas, camera, platforms, flag_rect, feed.enemies, feed.players, flag_tri)
+        canvas.present()
+
+        if feed.synced:
+            hud = f"SCORE: {feed.players[0].score}" if feed.players else ""
+            if feed.status == STATUS_WIN: hud += "   COURSE CLEAR!"
+            elif feed.status == STATUS_DEAD: hud += "   GAME OVER"
+            screen.blit(font_main.render(hud, True, WHITE), HUD_SCORE_POS)
+        else:
+            screen.blit(font_small.render("Waiting for keyframe...", True, WHITE), HUD_TIMING_POS)
+        screen.blit(font_small.render(f"WATCHING {address}  frame {feed.frame}", True, WHITE), HUD_SPECTATE_POS)
+
+        pygame.display.flip()
+        clock.tick(FPS)
+
+    sock.close()
+    pygame.quit()
+    sys.exit()
+
+# ---------- Play Screen ----------
+
+def step_single(player, camera, platforms, enemies, triggers, events, endless, buttons):
+    # One single-player frame; co-op steps a World through RollbackSession
+    player.update(platforms, enemies, buttons)
+    camera.update(player)
+    if endless:
+        endless.update(-camera.camera.x)
+
+    # Pits and the flag
+    triggers.sense(0, player.rect, events)
+    apply_triggers(player, events)
+
+    # Update enemies
+    cam_x_start = -camera.camera.x - 100
+    cam_x_end = -camera.camera.x + SCREEN_WIDTH + 100
+    for e in enemies:
+        if cam_x_start < e.rect.x < cam_x_end:
+            e.update(platforms)
+
+class Hud:
+    # Play-screen text, drawn at window resolution after the upscale. Text is
+    # only re-rendered when it changes, timing twice a second.
+    def __init__(self, font_main, font_small, frame_timer, gc_pacer):
+        self.font_main = font_main
+        self.font_small = font_small
+        self.frame_timer = frame_timer
+        self.gc_pacer = gc_pacer
+        self.score = None
+        self.text_score = None
+        self.text_timing = font_small.render(frame_timer.text(1), True, WHITE)
+        self.text_gc = font_small.render(gc_pacer.text(), True, WHITE)
+        self.labels = {} # HUD position -> (text, rendered text)
+
+    def label(self, screen, text, pos):
+        # Optional status lines, re-rendered only when their text changes
+        cached = self.labels.get(pos)
+        if cached is None or cached[0] != text:
+            cached = self.labels[pos] = (text, self.font_small.render(text, True, WHITE))
+        screen.blit(cached[1], pos)
+
+    def draw(self, screen, scale, player, session, indexed, spectators):
+        font_small = self.font_small
+        if player.score != self.score:
+            self.score = player.score
+            self.text_score = self.font_main.render(f"SCORE: {player.score}", True, WHITE)
+        if self.frame_timer.frames % (FPS // 2) == 1:
+            self.text_timing = font_small.render(self.frame_timer.text(scale), True, WHITE)
+            self.text_gc = font_small.render(self.gc_pacer.text(), True, WHITE)
+        screen.blit(self.text_score, HUD_SCORE_POS)
+        screen.blit(self.text_timing, HUD_TIMING_POS)
+        screen.blit(self.text_gc, HUD_GC_POS)
+        if session:
+            self.label(screen, session.text(), HUD_NET_POS)
+        if indexed:
+            self.label(screen, indexed.text(), HUD_INDEXED_POS)
+        if spectators:
+            self.label(screen, spectators.text(), HUD_SPECTATE_POS)
+
+def draw_play(screen, canvas, camera, hud, platforms, flag_rect, enemies, players, player, flag_tri,
+              session=None, indexed=None, spectators=None):
+    # One frame of the play screen: world, upscale, then the HUD on top
+    hud.frame_timer.begin()
+    canvas.fill(SKY_BLUE)
+    if indexed:
+        # 8-bit path: cached palettized chunks and sprites
+        indexed.draw(canvas, camera, enemies, players)
+    else:
+        draw_world(canvas, camera, platforms, flag_rect, enemies, players, flag_tri)
+    canvas.present()
+    hud.frame_timer.end(canvas.scale)
+    hud.draw(screen, canvas.scale, player, session, indexed, spectators)
 
 # ---------- Main Game Loop ----------
 
@@ -313,6 +1916,9 @@ def main():
     screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
     pygame.display.set_caption("Super Mario Python 1-1")
     clock = pygame.time.Clock()
+    canvas = Canvas(screen)
+    frame_timer = FrameTimer()
+    gc_pacer = GCPacer()
     
     # Fonts
     font_main = pygame.font.Font(None, 40)
@@ -332,23 +1938,104 @@ def main():
     enemies = []
     level_width = 0
     flag_rect = None
+    triggers = None
+    trigger_events = []
+    endless = None
     player = None
+    players = []
     camera = None
+    # Single-player and endless enemies are reused across levels
+    enemy_pools = {cls: EntityPool(cls) for cls in (Enemy, FixedEnemy)}
+    enemy_pool = None # Pool the current enemies came from
+
+    # Two-player netplay, when started with --coop
+    capture = capture_from_env(screen.get_size())
+    indexed = None # IndexedRenderer while 8-bit mode is on (F4)
+    indexed_theme = "OVERWORLD"
+
+    coop = parse_coop_args(sys.argv[1:])
+    fixed_physics = False # Single-player physics core, F3 on the menu
+    channel = UdpChannel(coop[0], coop[1], coop[3], coop[4]) if coop else None
+    session = None
+    coop_round = 0 # Co-op rounds started; both peers count the same way
+    spectate_port = parse_spectate_args(sys.argv[1:])
+    spectators = SpectatorServer(spectate_port) if spectate_port else None
+
+    # Per-frame scratch state, allocated once
+    flag_tri = [[0, 0], [0, 0], [0, 0]]
+    hud = Hud(font_main, font_small, frame_timer, gc_pacer)
 
     running = True
     while running:
+        frame_start = time.perf_counter()
+
         # Event Handling
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
             
             if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F2:
+                    canvas.toggle()
+                elif event.key == pygame.K_F4:
+                    if indexed:
+                        indexed = None
+                    else:
+                        indexed = IndexedRenderer(indexed_theme)
+                        indexed.load(platforms, flag_rect)
+                elif event.key == pygame.K_F6:
+                    if capture and not capture.stopping.is_set():
+                        capture.stop()
+                    else:
+                        capture = FrameCapture(screen.get_size())
+                elif event.key == pygame.K_F5 and indexed:
+                    indexed.next_theme()
+                    indexed_theme = indexed.theme
+
                 if game_state == STATE_MENU:
-                    if event.key == pygame.K_RETURN:
+                    if event.key in (pygame.K_RETURN, pygame.K_e):
+                        # A level is starting: the last one's enemies go back first
+                        if endless: endless.release()
+                        elif enemy_pool: enemy_pool.release(enemies)
+                        enemy_pool = None
+                    if event.key == pygame.K_RETURN and coop:
+                        # Start Co-op: both peers simulate the same World
+                        world = World(NET_LEVEL_SEED, 2, fixed=True)
+                        coop_round += 1
+                        session = RollbackSession(world, coop[2], channel, coop_round)
+                        platforms, enemies, level_width, flag_rect = world.platforms, world.enemies, world.width, world.flag_rect
+                        triggers = world.triggers
+                        endless = None
+                        gc_pacer.level_built()
+                        players = world.players
+                        player = players[coop[2]]
+                        camera = Camera(level_width, SCREEN_HEIGHT)
+                        if indexed: indexed.load(platforms, flag_rect)
+                        game_state = STATE_PLAYING
+                    elif event.key == pygame.K_RETURN:
                         # Start Game
-                        platforms, enemies, level_width, flag_rect = create_level()
+                        enemy_pool = enemy_pools[FixedEnemy if fixed_physics else Enemy]
+                        platforms, enemies, level_width, flag_rect, triggers = create_level(fixed=fixed_physics, pool=enemy_pool)
+                        endless = None
+                        gc_pacer.level_built()
+                        player = FixedPlayer(100, 100) if fixed_physics else Player(100, 100)
+                        players = [player]
+                        camera = Camera(level_width, SCREEN_HEIGHT)
+                        if indexed: indexed.load(platforms, flag_rect)
+                        game_state = STATE_PLAYING
+                    elif event.key == pygame.K_F3:
+                        fixed_physics = not fixed_physics
+                    elif event.key == pygame.K_e:
+                        # Endless mode: no flag, level streamed in chunks
+                        endless = EndlessLevel(ENDLESS_SEED, enemy_pools[Enemy])
+                        platforms, enemies = endless.platforms, endless.enemies
+                        level_width, flag_rect = ENDLESS_WIDTH, None
+                        triggers = endless.triggers
+                        gc_pacer.level_built()
                         player = Player(100, 100)
+                        players = [player]
                         camera = Camera(level_width, SCREEN_HEIGHT)
+                        if indexed: indexed.load(platforms, flag_rect)
                         game_state = STATE_PLAYING
                 
                 elif game_state == STATE_GAMEOVER or game_state == STATE_WIN:
@@ -375,65 +2062,43 @@ def main():
             cred_surf = font_small.render("2D BROS STYLE - 60 FPS", True, MARIO_RED)
             screen.blit(cred_surf, (SCREEN_WIDTH//2 - cred_surf.get_width()//2, 350))
 
-        elif game_state == STATE_PLAYING:
-            player.update(platforms, enemies)
+            endless_surf = font_small.render("PRESS E FOR ENDLESS MODE", True, WHITE)
+            screen.blit(endless_surf, (SCREEN_WIDTH//2 - endless_surf.get_width()//2, 380))
+
+            physics_name = "FIXED-POINT" if fixed_physics else "FLOAT"
+            physics_surf = font_small.render(f"PHYSICS: {physics_name} [F3]", True, WHITE)
+            screen.blit(physics_surf, (SCREEN_WIDTH//2 - physics_surf.get_width()//2, 410))
+
+        elif game_state == STATE_PLAYING and session:
+            # Co-op: the session steps (and rolls back) the shared World.
+            # Round results come from confirmed state only.
+            session.tick(read_input())
             camera.update(player)
-            
-            # Check Win
-            if player.rect.colliderect(flag_rect):
+            outcome = session.outcome()
+            if outcome == STATUS_WIN:
                 game_state = STATE_WIN
-                player.win = True
-                player.vx = 0 # Stop movement
+            elif outcome == STATUS_DEAD:
+                game_state = STATE_GAMEOVER
 
-            # Check Death
-            if player.dead:
+        elif game_state == STATE_PLAYING:
+            step_single(player, camera, platforms, enemies, triggers, trigger_events, endless, read_input())
+            if player.win:
+                game_state = STATE_WIN
+            elif player.dead:
                 game_state = STATE_GAMEOVER
 
-            # Update enemies
-            cam_x_start = -camera.camera.x - 100
-            cam_x_end = -camera.camera.x + SCREEN_WIDTH + 100
-            for e in enemies:
-                if cam_x_start < e.rect.x < cam_x_end:
-                    e.update(platforms)
+        elif session:
+            session.idle()
 
-            # --- DRAWING ---
-            screen.fill(SKY_BLUE)
+        # Spectators see every frame of a round, including its end screen
+        if spectators and game_state != STATE_MENU:
+            status = STATUS_WIN if game_state == STATE_WIN else STATUS_DEAD if game_state == STATE_GAMEOVER else STATUS_PLAYING
+            spectators.publish(status, camera.camera.x, players, enemies)
 
-            # Draw Level
-            for p in platforms:
-                rect = camera.apply_rect(p)
-                color = GROUND_BROWN
-                if p.width == 64 and p.height >= 64: color = PIPE_GREEN 
-                elif p.width == 32 and p.height == 32 and p.y < SCREEN_HEIGHT - 100: color = BRICK_RED 
-                
-                pygame.draw.rect(screen, color, rect)
-                pygame.draw.rect(screen, BLACK, rect, 2) 
-
-                if color == PIPE_GREEN:
-                    pygame.draw.rect(screen, PIPE_DARK, (rect.x, rect.y, rect.width, 30))
-                    pygame.draw.rect(screen, BLACK, (rect.x, rect.y, rect.width, 30), 2)
-
-            # Draw Flagpole Visuals
-            pole_visual = camera.apply_rect(flag_rect)
-            pygame.draw.rect(screen, (200, 200, 200), pole_visual) # Gray Pole
-            # Ball on top
-            pygame.draw.circle(screen, BLOCK_GOLD, (pole_visual.centerx, pole_visual.top), 8)
-            # Flag (Triangle)
-            flag_tri = [
-                (pole_visual.left, pole_visual.top + 20),
-                (pole_visual.left - 40, pole_visual.top + 40),
-                (pole_visual.left, pole_visual.top + 60)
-            ]
-            pygame.draw.polygon(screen, MARIO_RED, flag_tri)
-
-            # Draw Entities
-            for e in enemies:
-                e.draw(screen, camera)
-            player.draw(screen, camera)
-            
-            # HUD
-            text_score = font_main.render(f"SCORE: {player.score}", True, WHITE)
-            screen.blit(text_score, (20, 20))
+        # --- DRAWING ---
+        if game_state == STATE_PLAYING:
+            draw_play(screen, canvas, camera, hud, platforms, flag_rect, enemies, players, player, flag_tri,
+                      session, indexed, spectators)
 
         elif game_state == STATE_GAMEOVER:
             screen.fill(BLACK)
@@ -444,17 +2109,22 @@ def main():
 
         elif game_state == STATE_WIN:
             # Keep drawing level in background, but frozen
-            screen.fill(SKY_BLUE)
-            for p in platforms:
-                pygame.draw.rect(screen, GROUND_BROWN, camera.apply_rect(p))
-            
-            # Draw Pole
-            pole_visual = camera.apply_rect(flag_rect)
-            pygame.draw.rect(screen, (200, 200, 200), pole_visual)
-            pygame.draw.circle(screen, BLOCK_GOLD, (pole_visual.centerx, pole_visual.top), 8)
-            
-            # Draw Player at flag
-            player.draw(screen, camera)
+            canvas.fill(SKY_BLUE)
+            if indexed:
+                # Same cached chunks and theme as the play screen
+                indexed.draw(canvas, camera, (), (player,))
+            else:
+                for p in platforms:
+                    canvas.rect(GROUND_BROWN, camera.apply_rect(p))
+
+                # Draw Pole
+                pole_visual = camera.apply_rect(flag_rect)
+                canvas.rect(FLAG_GRAY, pole_visual)
+                canvas.circle(BLOCK_GOLD, (pole_visual.centerx, pole_visual.top), 8)
+
+                # Draw Player at flag
+                player.draw(canvas, camera)
+            canvas.present()
 
             # Overlay
             msg = font_title.render("COURSE CLEAR!", True, WHITE)
@@ -472,11 +2142,36 @@ def main():
             sub = font_small.render("Press ENTER to Return", True, WHITE)
             screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, center_y + 130))
 
+        # Capture before the REC indicator so it stays out of the recording
+        if capture and capture.finished is not None and time.perf_counter() - capture.finished > CAPTURE_NOTICE:
+            capture = None
+        if capture:
+            if not capture.stopping.is_set():
+                capture.capture(screen)
+            screen.blit(font_small.render(capture.text(), True, MARIO_RED), HUD_CAPTURE_POS)
+
         pygame.display.flip()
+
+        # Collections happen here, between frames, and only while playing
+        gc_pacer.set_playing(game_state == STATE_PLAYING)
+        gc_pacer.frame_boundary(1000 / FPS - (time.perf_counter() - frame_start) * 1000)
         clock.tick(FPS)
 
+    if capture:
+        capture.stop()
+    if spectators:
+        spectators.close()
+    # Close the window first; a capture may still be flushing its queue
+    pygame.display.quit()
+    if capture:
+        capture.writer.join()
     pygame.quit()
     sys.exit()
 
 if __name__ == "__main__":
-    main()
+    if "--split" in sys.argv:
+        main_split()
+    elif "--watch" in sys.argv:
+        main_watch(sys.argv[sys.argv.index("--watch") + 1])
+    else:
+        main()
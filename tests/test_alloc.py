@@ -0,0 +1,92 @@
+import os
+import sys
+import tracemalloc
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pygame
+import smb14k
+import ACCatSMB4K
+
+WARMUP = 60
+FRAMES = 120
+BUDGET = 4 * 1024 # bytes; steady-state frames should reuse what they have
+
+def measure(frame):
+    # -> (net growth, peak above the start) over FRAMES traced frames
+    for _ in range(WARMUP):
+        frame()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for _ in range(FRAMES):
+            frame()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current - start, peak - start
+
+@pytest.fixture
+def screen():
+    pygame.init()
+    yield pygame.display.set_mode((smb14k.SCREEN_WIDTH, smb14k.SCREEN_HEIGHT))
+    pygame.quit()
+
+@pytest.mark.parametrize("low_res", [False, True])
+def test_smb14k_steady_state_frames(screen, low_res):
+    canvas = smb14k.Canvas(screen)
+    canvas.set_low_res(low_res)
+    hud = smb14k.Hud(pygame.font.Font(None, 40), pygame.font.Font(None, 24), smb14k.FrameTimer(), smb14k.GCPacer())
+    platforms, enemies, width, flag_rect, triggers = smb14k.create_level()
+    player = smb14k.Player(100, 100)
+    camera = smb14k.Camera(width, smb14k.SCREEN_HEIGHT)
+    events = []
+    flag_tri = [[0, 0], [0, 0], [0, 0]]
+
+    def frame():
+        # The single-player steps of smb14k.main()
+        pygame.event.get()
+        smb14k.step_single(player, camera, platforms, enemies, triggers, events, None, smb14k.BUTTON_RIGHT)
+        smb14k.draw_play(screen, canvas, camera, hud, platforms, flag_rect, enemies, [player], player, flag_tri)
+        pygame.display.flip()
+
+    growth, peak = measure(frame)
+    assert growth < BUDGET
+    assert peak < BUDGET
+
+@pytest.mark.parametrize("low_res", [False, True])
+def test_accat_steady_state_frames(screen, low_res):
+    game = ACCatSMB4K
+    # The draw code reads the display and canvas from module globals
+    game.screen = screen
+    game.canvas = game.Canvas(screen)
+    if low_res:
+        game.canvas.toggle()
+    pool = game.EntityPool(game.Goomba)
+    cache = game.LevelCache()
+    platforms, hidden, goombas, flag, width, grid, nav = game.load_level(cache.compiled(), pool)
+    sections = game.SectionCache(platforms, width)
+    hud = game.Hud(pygame.font.Font(None, 24), pygame.font.Font(None, 40), game.FrameTimer(), game.GCPacer(), cache, pool)
+    player = game.Player(*game.PLAYER_START)
+    camera = game.Camera(width)
+    keys = game.ReplayKeys()
+    keys.buttons = game.pack_buttons({pygame.K_LEFT: False, pygame.K_RIGHT: True, pygame.K_SPACE: False})
+
+    def frame():
+        # The play-state steps of the ACCatSMB4K game loop
+        pygame.event.get()
+        game.play_frame(player, keys, platforms, hidden, goombas, flag, grid, nav, sections, pool)
+        camera.update(player)
+        game.draw_frame(camera, sections, flag, goombas, player, grid, nav, hud)
+        pygame.display.flip()
+
+    try:
+        growth, peak = measure(frame)
+    finally:
+        sections.close()
+    assert growth < BUDGET
+    assert peak < BUDGET
@@ -0,0 +1,100 @@
+import os
+import sys
+import time
+import multiprocessing
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import smb14k
+
+PORTS = (47311, 47312)
+MAX_TICKS = 3000
+
+def script(index, frame):
+    # Both players run right and jump on a staggered rhythm, so the remote
+    # input keeps changing and predictions keep missing
+    buttons = smb14k.BUTTON_RIGHT
+    if (frame // 7 + index) % 3 == 0:
+        buttons |= smb14k.BUTTON_JUMP
+    return buttons
+
+def peer(index, delay, loss, start_after, rounds, linger, results):
+    time.sleep(start_after)
+    channel = smb14k.UdpChannel(PORTS[index], ("127.0.0.1", PORTS[1 - index]), delay, loss, seed=index)
+    played = []
+    for round_id in range(1, rounds + 1):
+        world = smb14k.World(smb14k.NET_LEVEL_SEED, 2, fixed=True)
+        session = smb14k.RollbackSession(world, index, channel, round_id)
+        outcome = smb14k.STATUS_PLAYING
+        ticks = 0
+        while outcome == smb14k.STATUS_PLAYING and ticks < MAX_TICKS:
+            session.tick(script(index, world.frame))
+            outcome = session.outcome()
+            ticks += 1
+            time.sleep(0.001)
+        # Stay on the end screen, answering so the other peer can confirm
+        # its last frames too, then press ENTER for the next round
+        end = time.perf_counter() + linger
+        while time.perf_counter() < end:
+            session.idle()
+            time.sleep(0.001)
+        confirmed = {f: h for f, h in session.hashes.items() if f <= session.remote_confirmed}
+        played.append((outcome, ticks, session.desync_frame, confirmed))
+    results.put((index, played))
+    channel.close()
+
+def run_pair(delay, loss, late_start, rounds=1, lingers=(0.3, 0.3)):
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=peer, args=(i, delay, loss, late_start * i, rounds, lingers[i], results))
+             for i in range(2)]
+    for p in procs: p.start()
+    out = dict(results.get(timeout=120) for _ in procs)
+    for p in procs: p.join(10)
+    return out
+
+def check_round(a, b):
+    for outcome, ticks, desync, _ in (a, b):
+        assert outcome != smb14k.STATUS_PLAYING, "a peer never left the round"
+        assert ticks < MAX_TICKS
+        assert desync is None
+    assert a[0] == b[0]
+    common = a[3].keys() & b[3].keys()
+    assert common
+    assert all(a[3][f] == b[3][f] for f in common)
+
+@pytest.mark.parametrize("delay, loss, late_start", [
+    (0, 0.0, 0.5), # one peer presses ENTER well before the other
+    (3, 0.0, 0.0),
+    (5, 0.2, 0.0),
+])
+def test_two_peers_agree_and_finish(delay, loss, late_start):
+    out = run_pair(delay, loss, late_start)
+    check_round(out[0][0], out[1][0])
+
+def test_restart_ignores_the_previous_round():
+    # Peer 0 restarts at once while peer 1 sits on the end screen still
+    # sending round 1 packets; round 2 must not compare against them
+    out = run_pair(2, 0.0, 0.0, rounds=2, lingers=(0.1, 1.5))
+    for r in range(2):
+        check_round(out[0][r], out[1][r])
+
+def test_outcome_waits_for_confirmed_input():
+    # A win seen only under predicted remote input must not end the round
+    class Silent:
+        def send(self, packet): pass
+        def flush(self): pass
+        def receive(self): return iter(())
+    world = smb14k.World(smb14k.NET_LEVEL_SEED, 2, fixed=True)
+    session = smb14k.RollbackSession(world, 0, Silent())
+    session.tick(0)
+    world.players[0].win = True
+    assert session.outcome() == smb14k.STATUS_PLAYING
+
+def test_coop_args_carry_delay_and_loss():
+    args = ["--coop", "5000", "127.0.0.1:5001", "2", "--delay", "4", "--loss", "0.1"]
+    assert smb14k.parse_coop_args(args) == (5000, ("127.0.0.1", 5001), 1, 4, 0.1)
+    assert smb14k.parse_coop_args(args[:4])[3:] == (0, 0.0)
@@ -0,0 +1,58 @@
+import os
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import ACCatSMB4K as game
+
+ROW = 9 # the long brick row over columns 99-114
+
+def level():
+    pool = game.EntityPool(game.Goomba)
+    platforms, hidden, goombas, flag, width, grid, nav = game.load_level(game.LevelCache().compiled(), pool)
+    return platforms, hidden, goombas, grid, nav
+
+def surface(nav, grid, col, row):
+    return nav.surface_at[row * grid.cols + col]
+
+def graph(nav):
+    # Surfaces and their edges by position, independent of surface ids
+    edges = {}
+    for s, span in enumerate(nav.surfaces):
+        if span is not None:
+            edges[span] = sorted((kind, x, heading, nav.surfaces[t]) for kind, x, heading, t in
+                                 (nav.edges[e] for e in nav.out[s]))
+    return edges
+
+def bump(col, row, platforms, hidden, goombas, grid, nav):
+    block = next(b for b in platforms + hidden if b.rect.topleft == (col * game.TILE, row * game.TILE))
+    game.bump_block(block, game.Player(*game.PLAYER_START), platforms, hidden, goombas, grid, nav, None)
+
+def test_breaking_a_brick_splits_the_route_over_it():
+    platforms, hidden, goombas, grid, nav = level()
+    left, right = surface(nav, grid, 100, ROW), surface(nav, grid, 112, ROW)
+    assert left == right # one surface: walking across needs no edge
+
+    bump(106, ROW, platforms, hidden, goombas, grid, nav)
+    left, right = surface(nav, grid, 100, ROW), surface(nav, grid, 112, ROW)
+    assert surface(nav, grid, 106, ROW) == -1
+    assert left != right
+    assert nav.surfaces[left] == (ROW, 99, 105)
+    assert nav.surfaces[right] == (ROW, 107, 114)
+    # Crossing the hole now takes a jump from the left piece's end
+    e = nav.next_hop[left][right]
+    assert e >= 0 and nav.edges[e][0] == game.NAV_JUMP
+
+def test_bumped_tiles_match_a_full_rebuild():
+    platforms, hidden, goombas, grid, nav = level()
+    for col, row in ((106, ROW), (99, ROW), (21, 9), (22, 13), (91, 13), (154, 13)):
+        bump(col, row, platforms, hidden, goombas, grid, nav)
+        assert graph(nav) == graph(game.NavGraph(grid))
+
+def test_revealed_hidden_block_is_a_surface():
+    platforms, hidden, goombas, grid, nav = level()
+    bump(91, 13, platforms, hidden, goombas, grid, nav)
+    s = surface(nav, grid, 91, 13)
+    assert s >= 0 and nav.surfaces[s] == (13, 91, 91)